@@ -1,36 +1,59 @@
-from pydantic_settings import BaseSettings
+from functools import lru_cache
+
+from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
 class Settings(BaseSettings):
     """Application settings from environment variables"""
 
+    model_config = SettingsConfigDict(env_file=".env", case_sensitive=False, extra="ignore")
+
     # ClamAV Configuration
     clamav_type: str = "unix"  # "unix" or "tcp"
     clamav_unix_socket: str = "/var/run/clamav/clamd.ctl"
     clamav_host: str = "localhost"
     clamav_port: int = 3310
     clamav_timeout: int = 30
+    clamav_version_cache_ttl: int = 60
+    clamav_health_cache_ttl: int = 5
+    clamav_chunk_size: int = 64 * 1024  # 64KB per INSTREAM chunk
+    clamav_socket_send_buffer: int = 1024 * 1024  # 1MB SO_SNDBUF
 
     # File Upload Configuration
     max_file_size: int = 100 * 1024 * 1024  # 100MB
     max_files: int = 10
+    scan_concurrency: int = 4  # Files from one request scanned at the same time
+    max_concurrent_scans: int = 16  # Threads running clamd scans across all requests
     upload_timeout: int = 300
+    stream_spool_max_size: int = 8 * 1024 * 1024  # 8MB kept in memory before spilling to disk
 
     # Redis Cache Configuration
     redis_host: str = "localhost"
     redis_port: int = 6379
     cache_ttl: int = 86400  # 24 hours
     cache_enabled: bool = True
+    cache_min_size: int = 4 * 1024  # 4KB
+    l1_cache_size: int = 4096  # in-process results kept in front of Redis
+    l1_cache_ttl: int = 60
+    redis_max_connections: int = 64
+    redis_health_check_interval: int = 30
 
     # S3 Configuration (MinIO)
     s3_endpoint: str = "http://localhost:9000"
     s3_access_key: str = "minioadmin"
     s3_secret_key: str = "minioadmin"
     s3_bucket: str = "scans"
+    s3_max_pool_connections: int = 64
+    s3_connect_timeout: float = 5
+    s3_read_timeout: float = 30
 
     # Kafka Configuration (Redpanda)
     kafka_bootstrap_servers: str = "localhost:9092"
     kafka_topic: str = "scan-results"
+    kafka_linger_ms: int = 10
+    kafka_max_batch_size: int = 64 * 1024  # 64KB
+    kafka_acks: int = 1  # 0, 1, or -1 (all in-sync replicas)
+    kafka_compression_type: str = "lz4"  # gzip, snappy, lz4, zstd, or empty for none
 
     # RabbitMQ Configuration
     rabbitmq_host: str = "localhost"
@@ -38,6 +61,8 @@ class Settings(BaseSettings):
     rabbitmq_user: str = "guest"
     rabbitmq_password: str = "guest"
     rabbitmq_queue: str = "scan-results"
+    rabbitmq_linger_ms: int = 10
+    rabbitmq_compression: bool = False  # lz4-compress message bodies
 
     # Service Enable/Disable Flags
     enable_kafka: bool = True
@@ -48,10 +73,13 @@ class Settings(BaseSettings):
     app_name: str = "ClamAV API"
     app_version: str = "1.0.0"
     debug: bool = False
+    gzip_minimum_size: int = 1024  # Responses smaller than this are not compressed
+
 
-    class Config:
-        env_file = ".env"
-        case_sensitive = False
+@lru_cache(maxsize=1)
+def get_settings() -> Settings:
+    """Return the process-wide settings, parsing the environment only once."""
+    return Settings()
 
 
-settings = Settings()
+settings = get_settings()
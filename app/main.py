@@ -1,8 +1,16 @@
+import asyncio
+import hashlib
 import logging
+import queue
+import ssl
 from contextlib import asynccontextmanager
+from logging.handlers import QueueHandler, QueueListener
 
-from fastapi import FastAPI
+import orjson
+from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import ORJSONResponse
 
 from app.config import settings
 from app.routers import scan
@@ -12,81 +20,96 @@ from app.services.kafka_producer import kafka_producer
 from app.services.rabbitmq_producer import rabbitmq_producer
 from app.services.s3_client import s3_client
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+# Configure logging: handlers only enqueue records, and a listener thread
+# started by the lifespan writes them to stderr off the event loop
+log_queue: queue.Queue = queue.Queue(-1)
+log_stream_handler = logging.StreamHandler()
+log_stream_handler.setFormatter(
+    logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
 )
+log_listener = QueueListener(log_queue, log_stream_handler)
+log_queue_handler = QueueHandler(log_queue)
+log_queue_handler.setFormatter(logging.Formatter("%(message)s"))
+logging.basicConfig(level=logging.INFO, handlers=[log_queue_handler])
 logger = logging.getLogger(__name__)
 
+# What a failed connection means for the running service
+CONNECT_FAILURE_NOTES = {
+    "ClamAV client": "will retry on first request",
+    "Redis cache": "caching disabled",
+    "S3 client": "S3 scanning disabled",
+    "Kafka producer": "Kafka scanning disabled",
+    "RabbitMQ producer": "RabbitMQ scanning disabled",
+}
+
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """
     Startup and shutdown event handler.
 
-    Connects to ClamAV, Redis, S3, and Kafka on startup.
+    Connects to ClamAV, Redis, S3, Kafka, and RabbitMQ concurrently on startup.
     """
     # Startup
+    log_listener.start()
     logger.info("Starting ClamAV API...")
 
-    # Connect to ClamAV
-    clamav_connected = clamav_client.connect()
-    if clamav_connected:
-        logger.info("ClamAV client connected successfully")
-    else:
-        logger.warning("Failed to connect to ClamAV, will retry on first request")
-
-    # Connect to Redis cache
-    cache_connected = cache_client.connect()
-    if cache_connected:
-        logger.info("Redis cache connected successfully")
+    # OpenSSL dispatches SHA-256 to SHA-NI / ARMv8 crypto instructions when
+    # the CPU has them; CPython's builtin fallback never does
+    if hashlib.sha256.__name__ == "openssl_sha256":
+        logger.info("SHA-256 hashing backed by %s", ssl.OPENSSL_VERSION)
     else:
-        logger.warning("Failed to connect to Redis, caching disabled")
+        logger.warning("SHA-256 hashing is not OpenSSL-backed, file hashing will be slow")
 
-    # Connect to S3 (MinIO)
+    # The blocking clamd connect() runs in a worker thread so every handshake
+    # proceeds at the same time instead of one after another.
+    connections = {
+        "ClamAV client": asyncio.to_thread(clamav_client.connect),
+        "Redis cache": cache_client.connect(),
+    }
     if settings.enable_s3:
-        s3_connected = s3_client.connect()
-        if s3_connected:
-            logger.info("S3 client connected successfully")
-        else:
-            logger.warning("Failed to connect to S3, S3 scanning disabled")
+        connections["S3 client"] = s3_client.connect()
     else:
         logger.info("S3 scanning is disabled")
-
-    # Connect to Kafka (Redpanda)
     if settings.enable_kafka:
-        kafka_connected = await kafka_producer.connect()
-        if kafka_connected:
-            logger.info("Kafka producer connected successfully")
-        else:
-            logger.warning("Failed to connect to Kafka, Kafka scanning disabled")
+        connections["Kafka producer"] = kafka_producer.connect()
     else:
         logger.info("Kafka integration is disabled")
-
-    # Connect to RabbitMQ
     if settings.enable_rabbitmq:
-        rabbitmq_connected = rabbitmq_producer.connect()
-        if rabbitmq_connected:
-            logger.info("RabbitMQ producer connected successfully")
-        else:
-            logger.warning("Failed to connect to RabbitMQ, RabbitMQ scanning disabled")
+        connections["RabbitMQ producer"] = rabbitmq_producer.connect()
     else:
         logger.info("RabbitMQ integration is disabled")
 
+    results = await asyncio.gather(*connections.values(), return_exceptions=True)
+    for name, connected in zip(connections, results):
+        if connected is True:
+            logger.info("%s connected successfully", name)
+        elif isinstance(connected, Exception):
+            logger.error(
+                "Failed to connect %s: %s (%s)", name, CONNECT_FAILURE_NOTES[name], connected
+            )
+        else:
+            logger.warning("Failed to connect %s: %s", name, CONNECT_FAILURE_NOTES[name])
+
     yield
 
     # Shutdown
     logger.info("Shutting down ClamAV API...")
-    clamav_client.disconnect()
-    cache_client.disconnect()
+    disconnections = [
+        asyncio.to_thread(clamav_client.disconnect),
+        cache_client.disconnect(),
+    ]
     if settings.enable_s3:
-        s3_client.disconnect()
+        disconnections.append(s3_client.disconnect())
     if settings.enable_kafka:
-        await kafka_producer.disconnect()
+        disconnections.append(kafka_producer.disconnect())
     if settings.enable_rabbitmq:
-        rabbitmq_producer.disconnect()
+        disconnections.append(rabbitmq_producer.disconnect())
+    for error in await asyncio.gather(*disconnections, return_exceptions=True):
+        if isinstance(error, Exception):
+            logger.error("Error during shutdown: %s", error)
     logger.info("All clients disconnected")
+    log_listener.stop()
 
 
 # Initialize FastAPI app
@@ -94,6 +117,7 @@ app = FastAPI(
     title=settings.app_name,
     version=settings.app_version,
     description="REST API for scanning files using ClamAV",
+    default_response_class=ORJSONResponse,
     lifespan=lifespan,
 )
 
@@ -106,28 +130,51 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Compress larger bodies such as multi-file scan responses; small health
+# and root payloads stay below minimum_size and are sent as-is
+app.add_middleware(
+    GZipMiddleware,
+    minimum_size=settings.gzip_minimum_size,
+    compresslevel=5,
+)
+
 # Include routershttp://localhost:15672
 app.include_router(scan.router)
 
 
+# Settings do not change at runtime, so the root payload is encoded once
+ROOT_PAYLOAD = orjson.dumps({
+    "name": settings.app_name,
+    "version": settings.app_version,
+    "description": "REST API for scanning files using ClamAV",
+    "endpoints": {
+        "scan": "POST /api/v1/scan",
+        "scan-stream": "POST /api/v1/scan-stream",
+        "scan-s3": "POST /api/v1/scan-s3",
+        "scan-s3-rabbitmq": "POST /api/v1/scan-s3-rabbitmq",
+        "health": "GET /api/v1/health",
+        "version": "GET /api/v1/version",
+    },
+})
+
+
 @app.get("/")
 async def root():
     """Root endpoint with API information."""
-    return {
-        "name": settings.app_name,
-        "version": settings.app_version,
-        "description": "REST API for scanning files using ClamAV",
-        "endpoints": {
-            "scan": "POST /api/v1/scan",
-            "scan-s3": "POST /api/v1/scan-s3",
-            "scan-s3-rabbitmq": "POST /api/v1/scan-s3-rabbitmq",
-            "health": "GET /api/v1/health",
-            "version": "GET /api/v1/version",
-        },
-    }
+    return Response(content=ROOT_PAYLOAD, media_type="application/json")
+
+
+# Serve on uvloop's libuv event loop with the httptools HTTP parser; the
+# Docker image passes the same options on the uvicorn command line
+UVICORN_OPTIONS = {
+    "host": "0.0.0.0",
+    "port": 8080,
+    "loop": "uvloop",
+    "http": "httptools",
+}
 
 
 if __name__ == "__main__":
     import uvicorn
 
-    uvicorn.run(app, host="0.0.0.0", port=8080)
+    uvicorn.run(app, **UVICORN_OPTIONS)
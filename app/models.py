@@ -1,11 +1,18 @@
 from datetime import datetime
 from typing import List, Optional
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field
 
 
 class FileScanResult(BaseModel):
-    """Result of scanning a single file"""
+    """
+    Result of scanning a single file.
+
+    Results are always built server-side from trusted values, so the scan
+    paths use model_construct() to skip validation. They are frozen because
+    one instance is shared by duplicate uploads and by the in-process cache;
+    use model_copy(update=...) to derive a changed result.
+    """
 
     filename: str = Field(..., description="Original filename")
     size_bytes: int = Field(..., description="File size in bytes")
@@ -16,8 +23,9 @@ class FileScanResult(BaseModel):
     timestamp: datetime = Field(..., description="Scan timestamp")
     cached: bool = Field(False, description="Whether result was from cache")
 
-    class Config:
-        json_schema_extra = {
+    model_config = ConfigDict(
+        frozen=True,
+        json_schema_extra={
             "example": {
                 "filename": "document.pdf",
                 "size_bytes": 102400,
@@ -27,7 +35,8 @@ class FileScanResult(BaseModel):
                 "scan_time_seconds": 0.15,
                 "timestamp": "2026-01-31T10:30:00Z",
             }
-        }
+        },
+    )
 
 
 class ScanResponse(BaseModel):
@@ -39,8 +48,8 @@ class ScanResponse(BaseModel):
     error_files: int = Field(..., description="Number of files with scan errors")
     results: List[FileScanResult] = Field(..., description="Detailed results for each file")
 
-    class Config:
-        json_schema_extra = {
+    model_config = ConfigDict(
+        json_schema_extra={
             "example": {
                 "total_files": 2,
                 "clean_files": 1,
@@ -67,7 +76,8 @@ class ScanResponse(BaseModel):
                     },
                 ],
             }
-        }
+        },
+    )
 
 
 class HealthResponse(BaseModel):
@@ -92,13 +102,14 @@ class S3ScanRequest(BaseModel):
     kafka_topic: Optional[str] = Field(None, description="Kafka topic to send scan result to (uses default if not specified)")
     s3_bucket: Optional[str] = Field(None, description="S3 bucket name (uses default if not specified)")
 
-    class Config:
-        json_schema_extra = {
+    model_config = ConfigDict(
+        json_schema_extra={
             "example": {
                 "s3_key": "uploads/document.pdf",
                 "kafka_topic": "scan-results",
             }
-        }
+        },
+    )
 
 
 class S3RabbitMQScanRequest(BaseModel):
@@ -108,13 +119,14 @@ class S3RabbitMQScanRequest(BaseModel):
     rabbitmq_queue: Optional[str] = Field(None, description="RabbitMQ queue to send scan result to (uses default if not specified)")
     s3_bucket: Optional[str] = Field(None, description="S3 bucket name (uses default if not specified)")
 
-    class Config:
-        json_schema_extra = {
+    model_config = ConfigDict(
+        json_schema_extra={
             "example": {
                 "s3_key": "uploads/document.pdf",
                 "rabbitmq_queue": "scan-results",
             }
-        }
+        },
+    )
 
 
 class S3ScanAccepted(BaseModel):
@@ -124,11 +136,12 @@ class S3ScanAccepted(BaseModel):
     status: str = Field(default="accepted", description="Request status")
     message: str = Field(..., description="Status message")
 
-    class Config:
-        json_schema_extra = {
+    model_config = ConfigDict(
+        json_schema_extra={
             "example": {
                 "request_id": "abc123-def456-789",
                 "status": "accepted",
                 "message": "Scan request accepted. Result will be sent to Kafka topic 'scan-results'",
             }
-        }
+        },
+    )
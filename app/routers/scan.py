@@ -2,11 +2,38 @@ import asyncio
 import hashlib
 import io
 import logging
+import mmap
+import os
+import tempfile
 import uuid
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from typing import List
+from functools import partial
+from typing import (
+    Any,
+    AsyncIterator,
+    Awaitable,
+    BinaryIO,
+    Callable,
+    Dict,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    TypeVar,
+    Union,
+)
 
-from fastapi import APIRouter, BackgroundTasks, File, HTTPException, UploadFile, status
+import orjson
+from fastapi import (
+    APIRouter,
+    BackgroundTasks,
+    File,
+    HTTPException,
+    Request,
+    UploadFile,
+    status,
+)
 
 from app.config import settings
 from app.models import (
@@ -27,6 +54,196 @@ from app.services.s3_client import s3_client
 router = APIRouter(prefix="/api/v1", tags=["scan"])
 logger = logging.getLogger(__name__)
 
+# Uploads are hashed in 1MB reads rather than loaded whole
+UPLOAD_READ_CHUNK_SIZE = 1024 * 1024
+
+# S3 objects are streamed to ClamAV in 1MB reads
+S3_READ_CHUNK_SIZE = 1024 * 1024
+
+# SHA256 of zero bytes, reported for empty uploads without hashing them
+EMPTY_SHA256 = hashlib.sha256(b"").hexdigest()
+
+T = TypeVar("T")
+
+# Scans in progress, keyed by what they scan, so concurrent requests for the
+# same content share one clamd scan instead of each running their own
+_inflight: Dict[str, asyncio.Future] = {}
+
+# Outcome of a shared scan whose own request was cancelled before it finished
+_ABANDONED = object()
+
+
+# Blocking clamd scans run in their own bounded pool, so a burst of uploads
+# can't take every default-executor thread from hashing and health checks
+scan_executor = ThreadPoolExecutor(
+    max_workers=settings.max_concurrent_scans, thread_name_prefix="clamd-scan"
+)
+
+
+async def run_scan(scan: Callable[..., T], *args: Any) -> T:
+    """Run a blocking clamd call in the scan thread pool."""
+    return await asyncio.get_running_loop().run_in_executor(scan_executor, scan, *args)
+
+
+# Cache writes running in the background, referenced until they finish so
+# they aren't garbage collected mid-flight
+_background_writes: Set[asyncio.Task] = set()
+
+
+def cache_in_background(write: Awaitable[Any]) -> None:
+    """
+    Run a cache write without waiting for it.
+
+    Responses and published results don't depend on the write, so they
+    aren't held up by the Redis round-trip.
+    """
+    task = asyncio.ensure_future(write)
+    _background_writes.add(task)
+    task.add_done_callback(_background_writes.discard)
+
+
+def empty_file_result(filename: str, timestamp: datetime) -> FileScanResult:
+    """Result for an empty file, which has nothing for clamd to match."""
+    return FileScanResult.model_construct(
+        filename=filename,
+        size_bytes=0,
+        sha256_hash=EMPTY_SHA256,
+        status="clean",
+        virus_signature=None,
+        scan_time_seconds=0,
+        timestamp=timestamp,
+        cached=False,
+    )
+
+
+async def coalesce_scan(key: str, scan: Callable[[], Awaitable[T]]) -> T:
+    """
+    Run scan() unless a scan with the same key is already in flight, in
+    which case wait for that scan's outcome instead.
+    """
+    while key in _inflight:
+        outcome = await asyncio.shield(_inflight[key])
+        if outcome is not _ABANDONED:
+            return outcome
+
+    future = asyncio.get_running_loop().create_future()
+    _inflight[key] = future
+    try:
+        outcome = await scan()
+        future.set_result(outcome)
+        return outcome
+    except Exception as e:
+        future.set_exception(e)
+        # Mark the exception retrieved in case nobody else was waiting
+        future.exception()
+        raise
+    finally:
+        if not future.done():
+            # Our request was cancelled, e.g. its client disconnected. Other
+            # requests still want the result, so they run the scan themselves
+            future.set_result(_ABANDONED)
+        del _inflight[key]
+
+
+def digest_file(file_obj: BinaryIO) -> str:
+    """
+    Return the SHA256 hash of a whole file.
+
+    An upload's SpooledTemporaryFile is hashed without copying its content:
+    in place while it's held in memory, and memory-mapped once it has rolled
+    over to disk. Other files are read from the start.
+    """
+    new_hash = partial(hashlib.sha256, usedforsecurity=False)
+
+    # SpooledTemporaryFile keeps its content in a BytesIO until it rolls
+    # over to a real temporary file. Neither is public API, so this relies on
+    # the private _file attribute and falls back to reading the file
+    buffer = getattr(file_obj, "_file", file_obj)
+    if isinstance(buffer, io.BytesIO):
+        # file_digest hashes a BytesIO's buffer directly
+        return hashlib.file_digest(buffer, new_hash).hexdigest()
+
+    try:
+        fileno = buffer.fileno()
+        # Writes still sitting in the buffered file aren't on disk yet
+        buffer.flush()
+        if os.fstat(fileno).st_size:
+            with mmap.mmap(fileno, 0, access=mmap.ACCESS_READ) as mapped:
+                return new_hash(mapped).hexdigest()
+    except (AttributeError, OSError):
+        pass
+
+    file_obj.seek(0)
+    return hashlib.file_digest(file_obj, new_hash).hexdigest()
+
+
+async def hash_upload(
+    file: UploadFile, semaphore: asyncio.Semaphore, max_file_size: int
+) -> Tuple[int, str]:
+    """
+    Hash an uploaded file without loading it into memory.
+
+    When Starlette recorded the upload's size, the whole file is hashed in
+    one worker-thread pass with hashlib.file_digest, which reads into a
+    reused buffer. Otherwise it is hashed chunk by chunk and hashing stops
+    as soon as the file exceeds max_file_size. hashlib releases the GIL on
+    large buffers, so hashing in a thread keeps the loop free.
+
+    Returns the file's size, which is over max_file_size if the file is too
+    large, and its SHA256 hash.
+    """
+    async with semaphore:
+        if file.size is not None:
+            # Starlette records each part's size while parsing the form, so a
+            # known oversize upload is rejected without reading it back
+            if file.size > max_file_size:
+                return file.size, ""
+            return file.size, await asyncio.to_thread(digest_file, file.file)
+
+        sha256 = hashlib.sha256(usedforsecurity=False)
+        file_size = 0
+        while chunk := await file.read(UPLOAD_READ_CHUNK_SIZE):
+            file_size += len(chunk)
+            if file_size > max_file_size:
+                break
+            await asyncio.to_thread(sha256.update, chunk)
+
+        return file_size, sha256.hexdigest()
+
+
+async def scan_upload(
+    file: UploadFile, sha256_hash: str, semaphore: asyncio.Semaphore
+) -> FileScanResult:
+    """
+    Scan an uploaded file with ClamAV, sharing the scan with any concurrent
+    request for the same content.
+
+    Blocking clamd calls run in the scan thread pool so several files can be
+    scanned at once; the semaphore caps how many one request has in flight.
+    """
+    filename = file.filename or "unknown"
+
+    async def scan() -> FileScanResult:
+        # Rewind the upload's spooled file for scanning
+        await file.seek(0)
+
+        try:
+            result, error = await run_scan(clamav_client.scan_stream, file.file, filename)
+        except Exception as e:
+            logger.error("Unexpected error scanning %s: %s", filename, e)
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail="An error occurred while scanning files",
+            )
+
+        if error:
+            logger.error("Scan error for %s: %s", filename, error)
+
+        return result
+
+    async with semaphore:
+        return await coalesce_scan(sha256_hash, scan)
+
 
 @router.post("/scan", response_model=ScanResponse)
 async def scan_files(files: List[UploadFile] = File(...)):
@@ -35,6 +252,10 @@ async def scan_files(files: List[UploadFile] = File(...)):
 
     - **files**: List of files to scan (multipart/form-data)
 
+    All files are hashed first so the cache is checked for the whole batch
+    in one round-trip. Files with the same content are looked up and
+    scanned once, and cache misses are scanned concurrently, up to
+    settings.scan_concurrency at a time.
     Returns detailed scan results for each file.
     """
     if not clamav_client.client:
@@ -55,287 +276,397 @@ async def scan_files(files: List[UploadFile] = File(...)):
             detail=f"Maximum {settings.max_files} files allowed per request",
         )
 
-    results = []
-    clean_count = 0
-    infected_count = 0
-    error_count = 0
+    semaphore = asyncio.Semaphore(settings.scan_concurrency)
+    now = datetime.utcnow()
+    max_file_size = settings.max_file_size
+    cache_min_size = settings.cache_min_size
 
-    for file in files:
-        # Read file content
-        file_content = await file.read()
-        filename = file.filename or "unknown"
+    hashes = await asyncio.gather(
+        *(hash_upload(file, semaphore, max_file_size) for file in files)
+    )
 
-        # Validate file size
-        if len(file_content) > settings.max_file_size:
-            results.append(FileScanResult(
+    # Group the files by content; oversize and empty files are answered here
+    results: List[Optional[FileScanResult]] = [None] * len(files)
+    files_by_hash: Dict[str, List[int]] = {}
+    cacheable: List[str] = []
+    for index, (file, (file_size, sha256_hash)) in enumerate(zip(files, hashes)):
+        filename = file.filename or "unknown"
+        if file_size > max_file_size:
+            logger.warning("File %s exceeds max size of %s bytes", filename, max_file_size)
+            results[index] = FileScanResult.model_construct(
                 filename=filename,
-                size_bytes=len(file_content),
+                size_bytes=file_size,
                 sha256_hash="",
                 status="error",
                 virus_signature=None,
                 scan_time_seconds=0,
-                timestamp=datetime.utcnow(),
+                timestamp=now,
                 cached=False,
-            ))
-            error_count += 1
-            logger.warning(
-                f"File {filename} exceeds max size of {settings.max_file_size} bytes"
             )
-            continue
-
-        # Calculate SHA256 hash
-        sha256_hash = hashlib.sha256(file_content).hexdigest()
+        elif file_size == 0:
+            results[index] = empty_file_result(filename, now)
+        elif sha256_hash in files_by_hash:
+            files_by_hash[sha256_hash].append(index)
+        else:
+            files_by_hash[sha256_hash] = [index]
+            # Small files are cheaper to rescan than to look up
+            if file_size >= cache_min_size:
+                cacheable.append(sha256_hash)
+
+    # Check cache for existing results
+    cached_results = {}
+    if cacheable:
+        cached_results = await cache_client.get_many(cacheable)
+
+    to_scan = [sha256_hash for sha256_hash in files_by_hash if sha256_hash not in cached_results]
+    scanned = await asyncio.gather(
+        *(
+            scan_upload(files[files_by_hash[sha256_hash][0]], sha256_hash, semaphore)
+            for sha256_hash in to_scan
+        )
+    )
+    scanned_results = dict(zip(to_scan, scanned))
+
+    # Cache the new results, leaving out scan errors since they're often
+    # transient
+    cacheable_results = {
+        sha256_hash: scanned_results[sha256_hash]
+        for sha256_hash in cacheable
+        if sha256_hash in scanned_results and scanned_results[sha256_hash].status != "error"
+    }
+    if cacheable_results:
+        cache_in_background(cache_client.set_many(cacheable_results))
+
+    for sha256_hash, indexes in files_by_hash.items():
+        if sha256_hash in cached_results:
+            logger.info("Cache hit for hash %s...", sha256_hash[:16])
+            result = cached_results[sha256_hash].model_copy(
+                update={"timestamp": now, "cached": True}
+            )
+        else:
+            result = scanned_results[sha256_hash]
 
-        # Check cache for existing result
-        cached_result = cache_client.get_scan_result(sha256_hash)
-        if cached_result:
-            # Return cached result with updated filename and timestamp
-            cached_result.filename = filename
-            cached_result.timestamp = datetime.utcnow()
-            cached_result.cached = True
-
-            if cached_result.status == "clean":
-                clean_count += 1
-            elif cached_result.status == "infected":
-                infected_count += 1
+        for index in indexes:
+            filename = files[index].filename or "unknown"
+            if result.filename != filename:
+                results[index] = result.model_copy(update={"filename": filename})
             else:
-                error_count += 1
-
-            results.append(cached_result)
-            logger.info(f"Cache hit for {filename} (hash: {sha256_hash[:16]}...)")
-            continue
-
-        # Reset file pointer for scanning
-        await file.seek(0)
-
-        # Scan the file
-        try:
-            result, error = clamav_client.scan_stream(file.file, filename)
-
-            if error:
-                error_count += 1
-                logger.error(f"Scan error for {filename}: {error}")
-            elif result.status == "clean":
-                clean_count += 1
-            elif result.status == "infected":
-                infected_count += 1
-
-            # Cache the result
-            cache_client.set_scan_result(sha256_hash, result)
-
-            results.append(result)
+                results[index] = result
 
-        except Exception as e:
+    clean_count = 0
+    infected_count = 0
+    error_count = 0
+    for result in results:
+        if result.status == "clean":
+            clean_count += 1
+        elif result.status == "infected":
+            infected_count += 1
+        else:
             error_count += 1
-            logger.error(f"Unexpected error scanning {filename}: {e}")
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail="An error occurred while scanning files",
-            )
 
-    return ScanResponse(
+    # Counts and results are built server-side, so skip re-validating them
+    return ScanResponse.model_construct(
         total_files=len(files),
         clean_files=clean_count,
         infected_files=infected_count,
         error_files=error_count,
-        results=results,
+        results=list(results),
     )
 
 
-async def process_s3_scan(request_id: str, s3_key: str, s3_bucket: str, kafka_topic: str):
+@router.post("/scan-stream", response_model=FileScanResult)
+async def scan_raw_stream(request: Request, filename: str = "upload"):
     """
-    Background task to process S3 file scan.
+    Scan a single file sent as the raw request body.
+
+    - **filename**: Name reported in the result (query parameter)
 
-    1. Download file from S3
-    2. Calculate SHA256, check cache
-    3. If not cached, scan with ClamAV
-    4. Cache result
-    5. Send result to Kafka
+    The body is hashed as it arrives instead of being parsed as multipart
+    form data, so large files are not copied through an upload spool first.
     """
-    logger.info(f"[{request_id}] Starting S3 scan for {s3_key}")
+    if not clamav_client.client:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="ClamAV service is not available",
+        )
 
-    try:
-        # Download file from S3
-        file_content = s3_client.download_file(s3_key, s3_bucket)
-        if file_content is None:
-            error_result = {
-                "request_id": request_id,
-                "s3_key": s3_key,
-                "s3_bucket": s3_bucket,
-                "status": "error",
-                "error": "Failed to download file from S3",
-                "timestamp": datetime.utcnow().isoformat(),
-            }
-            await kafka_producer.send_result(kafka_topic, error_result)
-            logger.error(f"[{request_id}] Failed to download {s3_key} from S3")
-            return
+    max_file_size = settings.max_file_size
 
-        # Calculate SHA256 hash
-        sha256_hash = hashlib.sha256(file_content).hexdigest()
-        logger.info(f"[{request_id}] File hash: {sha256_hash[:16]}...")
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > max_file_size:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"File exceeds max size of {max_file_size} bytes",
+        )
 
-        # Check cache
-        cached_result = cache_client.get_scan_result(sha256_hash)
+    sha256 = hashlib.sha256(usedforsecurity=False)
+    file_size = 0
+    with tempfile.SpooledTemporaryFile(max_size=settings.stream_spool_max_size) as spool:
+        # Bind the per-chunk methods once rather than on every chunk
+        update = sha256.update
+        write = spool.write
+        async for chunk in request.stream():
+            file_size += len(chunk)
+            if file_size > max_file_size:
+                raise HTTPException(
+                    status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                    detail=f"File exceeds max size of {max_file_size} bytes",
+                )
+            update(chunk)
+            write(chunk)
+
+        if file_size == 0:
+            return empty_file_result(filename, datetime.utcnow())
+
+        sha256_hash = sha256.hexdigest()
+
+        # Check cache for existing result; small files are cheaper to rescan
+        # than to look up
+        use_cache = file_size >= settings.cache_min_size
+        cached_result = None
+        if use_cache:
+            cached_result = await cache_client.get_scan_result(sha256_hash)
         if cached_result:
-            cached_result.filename = s3_key
-            cached_result.timestamp = datetime.utcnow()
-            cached_result.cached = True
-
-            result_dict = cached_result.model_dump()
-            result_dict["request_id"] = request_id
-            result_dict["s3_key"] = s3_key
-            result_dict["s3_bucket"] = s3_bucket
-            result_dict["timestamp"] = result_dict["timestamp"].isoformat()
-
-            await kafka_producer.send_result(kafka_topic, result_dict)
-            logger.info(f"[{request_id}] Cache hit, sent result to Kafka")
-            return
+            cached_result = cached_result.model_copy(
+                update={"filename": filename, "timestamp": datetime.utcnow(), "cached": True}
+            )
+            logger.info("Cache hit for %s (hash: %s...)", filename, sha256_hash[:16])
+            return cached_result
 
-        # Scan with ClamAV
-        if not clamav_client.client:
-            error_result = {
-                "request_id": request_id,
-                "s3_key": s3_key,
-                "s3_bucket": s3_bucket,
-                "status": "error",
-                "error": "ClamAV service not available",
-                "timestamp": datetime.utcnow().isoformat(),
-            }
-            await kafka_producer.send_result(kafka_topic, error_result)
-            logger.error(f"[{request_id}] ClamAV not available")
-            return
+        async def scan() -> FileScanResult:
+            spool.seek(0)
+            result, error = await run_scan(clamav_client.scan_stream, spool, filename)
 
-        file_stream = io.BytesIO(file_content)
-        result, error = clamav_client.scan_stream(file_stream, s3_key)
+            if error:
+                logger.error("Scan error for %s: %s", filename, error)
 
-        if error:
-            logger.error(f"[{request_id}] Scan error: {error}")
+            # Errors are often transient, so only cache real verdicts
+            if use_cache and result.status != "error":
+                cache_in_background(cache_client.set_scan_result(sha256_hash, result))
 
-        # Cache the result
-        cache_client.set_scan_result(sha256_hash, result)
+            return result
 
-        # Send result to Kafka
-        result_dict = result.model_dump()
-        result_dict["request_id"] = request_id
-        result_dict["s3_key"] = s3_key
-        result_dict["s3_bucket"] = s3_bucket
-        result_dict["timestamp"] = result_dict["timestamp"].isoformat()
+        # Scan the file, or share a concurrent scan of the same content
+        result = await coalesce_scan(sha256_hash, scan)
 
-        await kafka_producer.send_result(kafka_topic, result_dict)
-        logger.info(f"[{request_id}] Scan complete, sent result to Kafka (status: {result.status})")
+    if result.filename != filename:
+        result = result.model_copy(update={"filename": filename})
+    return result
 
-    except Exception as e:
-        logger.error(f"[{request_id}] Unexpected error: {e}")
-        error_result = {
+
+async def find_cached_s3_result(
+    s3_key: str, s3_bucket: str, metadata: dict
+) -> Optional[FileScanResult]:
+    """
+    Look up a cached scan result for an S3 object without downloading it.
+
+    The object's hash comes from its SHA-256 checksum when S3 reports one,
+    otherwise from the hash recorded for this exact object version by an
+    earlier scan.
+    """
+    sha256_hash = metadata["sha256"] or await cache_client.get_object_hash(
+        s3_bucket, s3_key, metadata["etag"], metadata["version_id"]
+    )
+    if not sha256_hash:
+        return None
+
+    return await cache_client.get_scan_result(sha256_hash)
+
+
+async def limit_stream(chunks: AsyncIterator[bytes], max_size: int) -> AsyncIterator[bytes]:
+    """Pass chunks through, raising ValueError once more than max_size bytes have gone by."""
+    size = 0
+    async for chunk in chunks:
+        size += len(chunk)
+        if size > max_size:
+            raise ValueError(f"File exceeds max size of {max_size} bytes")
+        yield chunk
+
+
+async def scan_s3_object(
+    request_id: str, s3_key: str, s3_bucket: str, metadata: Optional[dict]
+) -> Optional[FileScanResult]:
+    """
+    Stream an S3 object into ClamAV, hashing it on the way, and cache the result.
+
+    The download and the scan both run on the event loop: each chunk read
+    from S3 is written straight to clamd. The stream is cut off past
+    max_file_size, since the object's size isn't always known up front.
+
+    Returns None if the object could not be downloaded.
+    """
+    body = await s3_client.open_stream(s3_key, s3_bucket)
+    if body is None:
+        return None
+
+    async with body:
+        result, error = await clamav_client.scan_stream_async(
+            limit_stream(body.iter_chunks(S3_READ_CHUNK_SIZE), settings.max_file_size), s3_key
+        )
+
+    if error:
+        logger.error("[%s] Scan error: %s", request_id, error)
+    else:
+        logger.info("[%s] File hash: %s...", request_id, result.sha256_hash[:16])
+
+        # Cache the result, and remember this object version's hash so a
+        # rescan can skip the download
+        if metadata:
+            cache_in_background(
+                cache_client.set_s3_scan_result(
+                    s3_bucket, s3_key, metadata["etag"], metadata["version_id"], result
+                )
+            )
+        else:
+            cache_in_background(cache_client.set_scan_result(result.sha256_hash, result))
+
+    return result
+
+
+def s3_result_payload(
+    result: FileScanResult, request_id: str, s3_key: str, s3_bucket: str, **overrides: Any
+) -> bytes:
+    """
+    Encode an S3 scan result as the JSON message sent to Kafka/RabbitMQ.
+
+    The message is built from the result's attributes rather than
+    model_dump(), and orjson encodes the timestamp itself, so the payload is
+    serialized once here and the producers send the bytes as-is. Overrides
+    replace result fields in the message without touching the result itself.
+    """
+    return orjson.dumps(
+        {
+            "filename": result.filename,
+            "size_bytes": result.size_bytes,
+            "sha256_hash": result.sha256_hash,
+            "status": result.status,
+            "virus_signature": result.virus_signature,
+            "scan_time_seconds": result.scan_time_seconds,
+            "timestamp": result.timestamp,
+            "cached": result.cached,
+            **overrides,
             "request_id": request_id,
             "s3_key": s3_key,
             "s3_bucket": s3_bucket,
-            "status": "error",
-            "error": str(e),
-            "timestamp": datetime.utcnow().isoformat(),
         }
-        try:
-            await kafka_producer.send_result(kafka_topic, error_result)
-        except Exception as kafka_error:
-            logger.error(f"[{request_id}] Failed to send error to Kafka: {kafka_error}")
+    )
+
+
+def s3_scan_key(s3_key: str, s3_bucket: str, metadata: Optional[dict]) -> str:
+    """Identify an S3 object version for coalescing concurrent scans of it."""
+    if metadata:
+        return f"s3:{s3_bucket}:{s3_key}:{metadata['etag']}:{metadata['version_id'] or ''}"
+    return f"s3:{s3_bucket}:{s3_key}"
+
+
+def s3_error_payload(
+    request_id: str, s3_key: str, s3_bucket: str, error: str, timestamp: str
+) -> Dict[str, Any]:
+    """Build the message published when an S3 scan can't produce a result."""
+    return {
+        "request_id": request_id,
+        "s3_key": s3_key,
+        "s3_bucket": s3_bucket,
+        "status": "error",
+        "error": error,
+        "timestamp": timestamp,
+    }
 
 
-async def process_s3_scan_rabbitmq(request_id: str, s3_key: str, s3_bucket: str, rabbitmq_queue: str):
+async def process_s3_scan(
+    request_id: str,
+    s3_key: str,
+    s3_bucket: str,
+    publish: Callable[[Union[bytes, Dict[str, Any]]], bool],
+    broker: str,
+):
     """
-    Background task to process S3 file scan and publish result to RabbitMQ.
+    Background task to process S3 file scan.
 
-    1. Download file from S3
-    2. Calculate SHA256, check cache
-    3. If not cached, scan with ClamAV
-    4. Cache result
-    5. Send result to RabbitMQ
+    1. Reject objects over max_file_size, then check cache using the object's metadata
+    2. If not cached, stream the file from S3 into ClamAV, hashing it on the way
+    3. Cache result
+    4. Publish result with publish(), which queues it for the named broker
     """
-    logger.info(f"[{request_id}] Starting S3 scan for {s3_key} (RabbitMQ)")
+    logger.info("[%s] Starting S3 scan for %s (%s)", request_id, s3_key, broker)
+    now = datetime.utcnow()
+    now_iso = now.isoformat()
 
     try:
-        # Download file from S3
-        file_content = s3_client.download_file(s3_key, s3_bucket)
-        if file_content is None:
-            error_result = {
-                "request_id": request_id,
-                "s3_key": s3_key,
-                "s3_bucket": s3_bucket,
-                "status": "error",
-                "error": "Failed to download file from S3",
-                "timestamp": datetime.utcnow().isoformat(),
-            }
-            await rabbitmq_producer.send_result(error_result, rabbitmq_queue)
-            logger.error(f"[{request_id}] Failed to download {s3_key} from S3")
+        metadata = await s3_client.head_object(s3_key, s3_bucket)
+        max_file_size = settings.max_file_size
+        if metadata and metadata["size"] > max_file_size:
+            publish(
+                s3_error_payload(
+                    request_id,
+                    s3_key,
+                    s3_bucket,
+                    f"File exceeds max size of {max_file_size} bytes",
+                    now_iso,
+                )
+            )
+            logger.warning(
+                "[%s] %s exceeds max size of %s bytes", request_id, s3_key, max_file_size
+            )
             return
 
-        # Calculate SHA256 hash
-        sha256_hash = hashlib.sha256(file_content).hexdigest()
-        logger.info(f"[{request_id}] File hash: {sha256_hash[:16]}...")
-
-        # Check cache
-        cached_result = cache_client.get_scan_result(sha256_hash)
+        # Check cache from the object's metadata before downloading it
+        cached_result = None
+        if metadata:
+            cached_result = await find_cached_s3_result(s3_key, s3_bucket, metadata)
         if cached_result:
-            cached_result.filename = s3_key
-            cached_result.timestamp = datetime.utcnow()
-            cached_result.cached = True
-
-            result_dict = cached_result.model_dump()
-            result_dict["request_id"] = request_id
-            result_dict["s3_key"] = s3_key
-            result_dict["s3_bucket"] = s3_bucket
-            result_dict["timestamp"] = result_dict["timestamp"].isoformat()
-
-            await rabbitmq_producer.send_result(result_dict, rabbitmq_queue)
-            logger.info(f"[{request_id}] Cache hit, sent result to RabbitMQ")
+            publish(
+                s3_result_payload(
+                    cached_result,
+                    request_id,
+                    s3_key,
+                    s3_bucket,
+                    filename=s3_key,
+                    timestamp=now,
+                    cached=True,
+                )
+            )
+            logger.info("[%s] Cache hit, queued result for %s", request_id, broker)
             return
 
         # Scan with ClamAV
         if not clamav_client.client:
-            error_result = {
-                "request_id": request_id,
-                "s3_key": s3_key,
-                "s3_bucket": s3_bucket,
-                "status": "error",
-                "error": "ClamAV service not available",
-                "timestamp": datetime.utcnow().isoformat(),
-            }
-            await rabbitmq_producer.send_result(error_result, rabbitmq_queue)
-            logger.error(f"[{request_id}] ClamAV not available")
+            publish(
+                s3_error_payload(
+                    request_id, s3_key, s3_bucket, "ClamAV service not available", now_iso
+                )
+            )
+            logger.error("[%s] ClamAV not available", request_id)
             return
 
-        file_stream = io.BytesIO(file_content)
-        result, error = clamav_client.scan_stream(file_stream, s3_key)
-
-        if error:
-            logger.error(f"[{request_id}] Scan error: {error}")
-
-        # Cache the result
-        cache_client.set_scan_result(sha256_hash, result)
-
-        # Send result to RabbitMQ
-        result_dict = result.model_dump()
-        result_dict["request_id"] = request_id
-        result_dict["s3_key"] = s3_key
-        result_dict["s3_bucket"] = s3_bucket
-        result_dict["timestamp"] = result_dict["timestamp"].isoformat()
+        # Stream the object into clamd, or share a concurrent scan of it
+        result = await coalesce_scan(
+            s3_scan_key(s3_key, s3_bucket, metadata),
+            lambda: scan_s3_object(request_id, s3_key, s3_bucket, metadata),
+        )
+        if result is None:
+            publish(
+                s3_error_payload(
+                    request_id, s3_key, s3_bucket, "Failed to download file from S3", now_iso
+                )
+            )
+            logger.error("[%s] Failed to download %s from S3", request_id, s3_key)
+            return
 
-        await rabbitmq_producer.send_result(result_dict, rabbitmq_queue)
-        logger.info(f"[{request_id}] Scan complete, sent result to RabbitMQ (status: {result.status})")
+        publish(s3_result_payload(result, request_id, s3_key, s3_bucket))
+        logger.info(
+            "[%s] Scan complete, queued result for %s (status: %s)",
+            request_id,
+            broker,
+            result.status,
+        )
 
     except Exception as e:
-        logger.error(f"[{request_id}] Unexpected error: {e}")
-        error_result = {
-            "request_id": request_id,
-            "s3_key": s3_key,
-            "s3_bucket": s3_bucket,
-            "status": "error",
-            "error": str(e),
-            "timestamp": datetime.utcnow().isoformat(),
-        }
+        logger.error("[%s] Unexpected error: %s", request_id, e)
         try:
-            await rabbitmq_producer.send_result(error_result, rabbitmq_queue)
-        except Exception as rabbitmq_error:
-            logger.error(f"[{request_id}] Failed to send error to RabbitMQ: {rabbitmq_error}")
+            publish(s3_error_payload(request_id, s3_key, s3_bucket, str(e), now_iso))
+        except Exception as publish_error:
+            logger.error("[%s] Failed to send error to %s: %s", request_id, broker, publish_error)
 
 
 @router.post("/scan/kafka", response_model=S3ScanAccepted, status_code=202)
@@ -380,15 +711,19 @@ async def scan_s3_file(request: S3ScanRequest, background_tasks: BackgroundTasks
     s3_bucket = request.s3_bucket or settings.s3_bucket
     kafka_topic = request.kafka_topic or settings.kafka_topic
 
-    # Validate S3 file exists
-    if not s3_client.file_exists(request.s3_key, s3_bucket):
+    # Validate S3 file and Kafka topic exist; the checks are independent
+    file_exists, topic_exists = await asyncio.gather(
+        s3_client.file_exists(request.s3_key, s3_bucket),
+        kafka_producer.topic_exists(kafka_topic),
+    )
+
+    if not file_exists:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"File '{request.s3_key}' not found in bucket '{s3_bucket}'",
         )
 
-    # Validate Kafka topic exists
-    if not await kafka_producer.topic_exists(kafka_topic):
+    if not topic_exists:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=f"Kafka topic '{kafka_topic}' does not exist",
@@ -400,10 +735,11 @@ async def scan_s3_file(request: S3ScanRequest, background_tasks: BackgroundTasks
         request_id,
         request.s3_key,
         s3_bucket,
-        kafka_topic,
+        partial(kafka_producer.enqueue_result, kafka_topic, key=request_id),
+        "Kafka",
     )
 
-    logger.info(f"[{request_id}] Accepted scan request for s3://{s3_bucket}/{request.s3_key}")
+    logger.info("[%s] Accepted scan request for s3://%s/%s", request_id, s3_bucket, request.s3_key)
 
     return S3ScanAccepted(
         request_id=request_id,
@@ -454,15 +790,20 @@ async def scan_s3_file_rabbitmq(request: S3RabbitMQScanRequest, background_tasks
     s3_bucket = request.s3_bucket or settings.s3_bucket
     rabbitmq_queue = request.rabbitmq_queue or settings.rabbitmq_queue
 
-    # Validate S3 file exists
-    if not s3_client.file_exists(request.s3_key, s3_bucket):
+    # Validate S3 file exists and declare the RabbitMQ queue concurrently;
+    # declaring is idempotent, so doing it for a missing file is harmless
+    file_exists, queue_declared = await asyncio.gather(
+        s3_client.file_exists(request.s3_key, s3_bucket),
+        rabbitmq_producer.declare_queue(rabbitmq_queue),
+    )
+
+    if not file_exists:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"File '{request.s3_key}' not found in bucket '{s3_bucket}'",
         )
 
-    # Declare RabbitMQ queue
-    if not rabbitmq_producer.declare_queue(rabbitmq_queue):
+    if not queue_declared:
         raise HTTPException(
             status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
             detail=f"Failed to declare RabbitMQ queue '{rabbitmq_queue}'",
@@ -470,14 +811,20 @@ async def scan_s3_file_rabbitmq(request: S3RabbitMQScanRequest, background_tasks
 
     # Add background task
     background_tasks.add_task(
-        process_s3_scan_rabbitmq,
+        process_s3_scan,
         request_id,
         request.s3_key,
         s3_bucket,
-        rabbitmq_queue,
+        partial(rabbitmq_producer.enqueue_result, queue_name=rabbitmq_queue),
+        "RabbitMQ",
     )
 
-    logger.info(f"[{request_id}] Accepted scan request for s3://{s3_bucket}/{request.s3_key} (RabbitMQ)")
+    logger.info(
+        "[%s] Accepted scan request for s3://%s/%s (RabbitMQ)",
+        request_id,
+        s3_bucket,
+        request.s3_key,
+    )
 
     return S3ScanAccepted(
         request_id=request_id,
@@ -491,9 +838,13 @@ async def health_check():
     """
     Check application and all service health status.
 
-    Returns status of ClamAV, Redis, S3, Kafka, and RabbitMQ services.
+    Returns status of ClamAV, Redis, S3, Kafka, and RabbitMQ services. The
+    ClamAV ping is reused for settings.clamav_health_cache_ttl seconds, so
+    frequent liveness probes don't each cost a clamd round-trip.
     """
-    clamav_ok = clamav_client.ping()
+    clamav_ok = await asyncio.to_thread(
+        clamav_client.ping, max_age=settings.clamav_health_cache_ttl
+    )
 
     # Collect service status
     services = {
@@ -540,7 +891,7 @@ async def health_check():
 @router.get("/version", response_model=VersionResponse)
 async def get_version():
     """Get API and ClamAV versions."""
-    clamav_version = clamav_client.get_version()
+    clamav_version = await asyncio.to_thread(clamav_client.get_version)
 
     if clamav_version is None:
         raise HTTPException(
@@ -548,7 +899,7 @@ async def get_version():
             detail="Unable to retrieve ClamAV version",
         )
 
-    return VersionResponse(
+    return VersionResponse.model_construct(
         api_version=settings.app_version,
         clamav_version=clamav_version,
     )
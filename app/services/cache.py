@@ -1,9 +1,11 @@
-import json
 import logging
-from datetime import datetime
-from typing import Optional
+from collections import OrderedDict
+from datetime import timezone
+from time import monotonic
+from typing import Dict, List, Optional, Tuple
 
-import redis
+import msgpack
+from redis import asyncio as redis
 
 from app.config import settings
 from app.models import FileScanResult
@@ -11,13 +13,76 @@ from app.models import FileScanResult
 logger = logging.getLogger(__name__)
 
 
+def _scan_key(sha256_hash: str) -> str:
+    """Redis key for a scan result; v2 entries are MessagePack, v1 were JSON."""
+    return f"scan:v2:{sha256_hash}"
+
+
+def _encode_result(result: FileScanResult) -> bytes:
+    """Pack a scan result, with its timestamp as a native MessagePack timestamp."""
+    data = result.model_dump()
+    # Timestamps are naive UTC; msgpack only packs timezone-aware datetimes
+    data["timestamp"] = data["timestamp"].replace(tzinfo=timezone.utc)
+    return msgpack.packb(data, datetime=True)
+
+
+def _decode_result(data: bytes) -> FileScanResult:
+    """Unpack a scan result packed by _encode_result."""
+    result_dict = msgpack.unpackb(data, timestamp=3)
+    result_dict["timestamp"] = result_dict["timestamp"].replace(tzinfo=None)
+    return FileScanResult.model_validate(result_dict)
+
+
+class _L1Cache:
+    """
+    Small in-process LRU of recent scan results, checked before Redis.
+
+    Entries expire after ttl seconds so changes made through Redis show up
+    quickly. It is only used from the event loop, so it needs no locking.
+    """
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[float, FileScanResult]]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[FileScanResult]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if monotonic() - entry[0] >= self.ttl:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry[1]
+
+    def set(self, key: str, result: FileScanResult):
+        if self.max_size <= 0:
+            return
+        self._entries[key] = (monotonic(), result)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+
+
 class CacheClient:
-    """Redis cache client for storing scan results"""
+    """
+    Redis cache client for storing scan results.
+
+    Uses redis.asyncio, so lookups are awaited on the event loop and
+    concurrent requests share the connection pool instead of each tying
+    up a worker thread.
+    """
 
     def __init__(self):
+        self.pool: Optional[redis.ConnectionPool] = None
         self.client: Optional[redis.Redis] = None
+        self.l1 = _L1Cache(settings.l1_cache_size, settings.l1_cache_ttl)
 
-    def connect(self) -> bool:
+    async def connect(self) -> bool:
         """
         Establish connection to Redis.
 
@@ -28,50 +93,141 @@ class CacheClient:
             return False
 
         try:
-            self.client = redis.Redis(
+            self.pool = redis.ConnectionPool(
                 host=settings.redis_host,
                 port=settings.redis_port,
-                decode_responses=True,
+                decode_responses=False,
+                max_connections=settings.redis_max_connections,
+                health_check_interval=settings.redis_health_check_interval,
+                # Keep idle pooled sockets from being dropped by middleboxes
+                socket_keepalive=True,
+            )
+            self.client = redis.Redis(connection_pool=self.pool)
+            await self.client.ping()
+            logger.info(
+                f"Connected to Redis at {settings.redis_host}:{settings.redis_port} "
+                f"(max_connections={self.pool.max_connections}, "
+                f"health_check_interval={settings.redis_health_check_interval}s)"
             )
-            self.client.ping()
-            logger.info(f"Connected to Redis at {settings.redis_host}:{settings.redis_port}")
             return True
         except Exception as e:
-            logger.error(f"Failed to connect to Redis: {e}")
+            logger.error("Failed to connect to Redis: %s", e)
             self.client = None
+            self.pool = None
             return False
 
-    def disconnect(self):
+    async def disconnect(self):
         """Disconnect from Redis."""
         if self.client:
-            self.client.close()
+            await self.client.aclose()
             self.client = None
+        if self.pool:
+            await self.pool.disconnect()
+            self.pool = None
             logger.info("Disconnected from Redis")
+        self.l1.clear()
 
-    def get_scan_result(self, sha256_hash: str) -> Optional[FileScanResult]:
+    async def get_scan_result(self, sha256_hash: str) -> Optional[FileScanResult]:
         """
         Get cached scan result by SHA256 hash.
 
         Returns FileScanResult if found, None otherwise.
         """
+        return (await self.get_many([sha256_hash])).get(sha256_hash)
+
+    async def get_many(self, sha256_hashes: List[str]) -> Dict[str, FileScanResult]:
+        """
+        Get cached scan results for several SHA256 hashes in one round-trip.
+
+        Recently seen results are served from the in-process L1 cache; the
+        rest are fetched from Redis with a single MGET. Callers must not
+        mutate the results.
+
+        Returns a dict of the results found, keyed by hash.
+        """
         if not self.client or not settings.cache_enabled:
-            return None
+            return {}
+
+        found: Dict[str, FileScanResult] = {}
+        missing: List[str] = []
+        for sha256_hash in sha256_hashes:
+            result = self.l1.get(sha256_hash)
+            if result is not None:
+                found[sha256_hash] = result
+            else:
+                missing.append(sha256_hash)
+
+        if not missing:
+            return found
 
         try:
-            key = f"scan:{sha256_hash}"
-            data = self.client.get(key)
-            if data:
-                result_dict = json.loads(data)
-                result_dict["timestamp"] = datetime.fromisoformat(result_dict["timestamp"])
-                return FileScanResult(**result_dict)
+            values = await self.client.mget([_scan_key(sha256_hash) for sha256_hash in missing])
+            for sha256_hash, data in zip(missing, values):
+                if data:
+                    result = _decode_result(data)
+                    self.l1.set(sha256_hash, result)
+                    found[sha256_hash] = result
+        except Exception as e:
+            logger.error("Failed to get cached results for %s hashes: %s", len(missing), e)
+
+        return found
+
+    async def set_scan_result(self, sha256_hash: str, result: FileScanResult) -> bool:
+        """
+        Cache scan result by SHA256 hash.
+
+        Returns True if successful, False otherwise.
+        """
+        return await self.set_many({sha256_hash: result})
+
+    async def set_many(self, results: Dict[str, FileScanResult]) -> bool:
+        """
+        Cache several scan results, keyed by SHA256 hash, in one pipelined
+        round-trip.
+
+        Returns True if successful, False otherwise.
+        """
+        if not self.client or not settings.cache_enabled:
+            return False
+
+        try:
+            pipe = self.client.pipeline(transaction=False)
+            for sha256_hash, result in results.items():
+                pipe.setex(_scan_key(sha256_hash), settings.cache_ttl, _encode_result(result))
+            await pipe.execute()
+            for sha256_hash, result in results.items():
+                self.l1.set(sha256_hash, result)
+            logger.debug("Cached %s scan results", len(results))
+            return True
+        except Exception as e:
+            logger.error("Failed to cache %s scan results: %s", len(results), e)
+            return False
+
+    async def get_object_hash(
+        self, bucket: str, key: str, etag: str, version_id: Optional[str] = None
+    ) -> Optional[str]:
+        """
+        Get the SHA256 hash recorded for an S3 object version.
+
+        Returns the hash if found, None otherwise.
+        """
+        if not self.client or not settings.cache_enabled:
             return None
+
+        try:
+            sha256_hash = await self.client.get(f"s3obj:{bucket}:{key}:{etag}:{version_id or ''}")
+            return sha256_hash.decode() if sha256_hash else None
         except Exception as e:
-            logger.error(f"Failed to get cached result for {sha256_hash}: {e}")
+            logger.error("Failed to get cached hash for s3://%s/%s: %s", bucket, key, e)
             return None
 
-    def set_scan_result(self, sha256_hash: str, result: FileScanResult) -> bool:
+    async def set_s3_scan_result(
+        self, bucket: str, key: str, etag: str, version_id: Optional[str], result: FileScanResult
+    ) -> bool:
         """
-        Cache scan result by SHA256 hash.
+        Cache a scan result and record it as the hash of an S3 object version.
+
+        Both keys are written in one pipelined round-trip.
 
         Returns True if successful, False otherwise.
         """
@@ -79,14 +235,19 @@ class CacheClient:
             return False
 
         try:
-            key = f"scan:{sha256_hash}"
-            data = result.model_dump()
-            data["timestamp"] = data["timestamp"].isoformat()
-            self.client.setex(key, settings.cache_ttl, json.dumps(data))
-            logger.debug(f"Cached scan result for {sha256_hash}")
+            pipe = self.client.pipeline(transaction=False)
+            pipe.setex(_scan_key(result.sha256_hash), settings.cache_ttl, _encode_result(result))
+            pipe.setex(
+                f"s3obj:{bucket}:{key}:{etag}:{version_id or ''}",
+                settings.cache_ttl,
+                result.sha256_hash,
+            )
+            await pipe.execute()
+            self.l1.set(result.sha256_hash, result)
+            logger.debug("Cached scan result for %s", result.sha256_hash)
             return True
         except Exception as e:
-            logger.error(f"Failed to cache result for {sha256_hash}: {e}")
+            logger.error("Failed to cache result for s3://%s/%s: %s", bucket, key, e)
             return False
 
 
@@ -1,9 +1,11 @@
+import asyncio
 import hashlib
-import io
 import logging
+import socket
+import struct
 from datetime import datetime
-from time import time
-from typing import BinaryIO, Optional, Tuple
+from time import monotonic, perf_counter
+from typing import AsyncIterable, BinaryIO, Optional, Tuple
 
 import clamd
 
@@ -13,12 +15,100 @@ from app.models import FileScanResult
 logger = logging.getLogger(__name__)
 
 
+class _ChunkedInstreamMixin:
+    """
+    Stream INSTREAM data in settings.clamav_chunk_size chunks.
+
+    clamd's own implementation sends 1 KiB per send() call, which costs
+    tens of thousands of syscalls for a large upload.
+    """
+
+    def _init_socket(self):
+        super()._init_socket()
+        self.clamd_socket.setsockopt(
+            socket.SOL_SOCKET, socket.SO_SNDBUF, settings.clamav_socket_send_buffer
+        )
+
+    def instream(self, buff):
+        try:
+            self._init_socket()
+            self._send_command("INSTREAM")
+
+            chunk_size = settings.clamav_chunk_size
+            if hasattr(buff, "readinto"):
+                # Read each chunk in place after its length prefix, so a chunk
+                # is sent without being copied into a new bytes object
+                buffer = bytearray(4 + chunk_size)
+                view = memoryview(buffer)
+                while length := buff.readinto(view[4:]):
+                    struct.pack_into("!L", buffer, 0, length)
+                    self.clamd_socket.sendall(view[: 4 + length])
+            else:
+                chunk = buff.read(chunk_size)
+                while chunk:
+                    self.clamd_socket.sendall(struct.pack("!L", len(chunk)) + chunk)
+                    chunk = buff.read(chunk_size)
+
+            self.clamd_socket.sendall(struct.pack("!L", 0))
+
+            result = self._recv_response()
+
+            if len(result) > 0:
+                if result == "INSTREAM size limit exceeded. ERROR":
+                    raise clamd.BufferTooLongError(result)
+
+                filename, reason, status = self._parse_response(result)
+                return {filename: (status, reason)}
+        finally:
+            self._close_socket()
+
+
+class ClamdNetworkSocket(_ChunkedInstreamMixin, clamd.ClamdNetworkSocket):
+    """clamd TCP connection with chunked INSTREAM"""
+
+
+class ClamdUnixSocket(_ChunkedInstreamMixin, clamd.ClamdUnixSocket):
+    """clamd Unix socket connection with chunked INSTREAM"""
+
+
+class HashingReader:
+    """
+    Read-only file wrapper that hashes and counts bytes as they are read.
+
+    Lets a file be hashed in the same pass that streams it to clamd.
+    """
+
+    def __init__(self, file_obj: BinaryIO):
+        self.file_obj = file_obj
+        self.sha256 = hashlib.sha256(usedforsecurity=False)
+        self.size = 0
+
+    def read(self, size: int = -1) -> bytes:
+        chunk = self.file_obj.read(size)
+        self.sha256.update(chunk)
+        self.size += len(chunk)
+        return chunk
+
+    def readinto(self, buffer: memoryview) -> int:
+        if hasattr(self.file_obj, "readinto"):
+            length = self.file_obj.readinto(buffer) or 0
+        else:
+            chunk = self.file_obj.read(len(buffer))
+            length = len(chunk)
+            buffer[:length] = chunk
+        self.sha256.update(buffer[:length])
+        self.size += length
+        return length
+
+
 class ClamAVClient:
     """Wrapper around clamd for ClamAV interactions"""
 
     def __init__(self):
         self.client: Optional[clamd.ClamD] = None
         self.connection_type = settings.clamav_type
+        self._version_cache: Optional[Tuple[float, str]] = None
+        self._ping_cache: Optional[Tuple[float, bool]] = None
 
     def connect(self) -> bool:
         """
@@ -26,15 +116,21 @@ class ClamAVClient:
 
         Returns True if successful, False otherwise.
         """
+        self._version_cache = None
+        self._ping_cache = None
         try:
             if self.connection_type == "unix":
-                self.client = clamd.ClamdUnixSocket(filename=settings.clamav_unix_socket)
+                self.client = ClamdUnixSocket(
+                    path=settings.clamav_unix_socket, timeout=settings.clamav_timeout
+                )
             elif self.connection_type == "tcp":
-                self.client = clamd.ClamdNetworkSocket(
-                    host=settings.clamav_host, port=settings.clamav_port
+                self.client = ClamdNetworkSocket(
+                    host=settings.clamav_host,
+                    port=settings.clamav_port,
+                    timeout=settings.clamav_timeout,
                 )
             else:
-                logger.error(f"Unknown connection type: {self.connection_type}")
+                logger.error("Unknown connection type: %s", self.connection_type)
                 return False
 
             # Test the connection
@@ -45,35 +141,55 @@ class ClamAVClient:
             )
             return True
         except Exception as e:
-            logger.error(f"Failed to connect to ClamAV: {e}")
+            logger.error("Failed to connect to ClamAV: %s", e)
             self.client = None
             return False
 
-    def ping(self) -> bool:
+    def ping(self, max_age: float = 0) -> bool:
         """
         Ping ClamAV daemon to check if it's alive.
 
+        A result less than max_age seconds old is returned instead of pinging
+        again, so frequent health probes share one clamd round-trip.
+
         Returns True if alive, False otherwise.
         """
         if not self.client:
             return False
 
+        now = monotonic()
+        if self._ping_cache and now - self._ping_cache[0] < max_age:
+            return self._ping_cache[1]
+
         try:
-            response = self.client.ping()
-            return response == "PONG"
+            alive = self.client.ping() == "PONG"
         except Exception as e:
-            logger.error(f"Ping failed: {e}")
-            return False
+            logger.error("Ping failed: %s", e)
+            alive = False
+
+        self._ping_cache = (now, alive)
+        return alive
 
     def get_version(self) -> Optional[str]:
-        """Get ClamAV version string."""
+        """
+        Get ClamAV version string.
+
+        The version is cached for settings.clamav_version_cache_ttl seconds
+        so repeated /version calls do not each cost a clamd round-trip.
+        """
         if not self.client:
             return None
 
+        now = monotonic()
+        if self._version_cache and now - self._version_cache[0] < settings.clamav_version_cache_ttl:
+            return self._version_cache[1]
+
         try:
-            return self.client.version()
+            version = self.client.version()
+            self._version_cache = (now, version)
+            return version
         except Exception as e:
-            logger.error(f"Failed to get ClamAV version: {e}")
+            logger.error("Failed to get ClamAV version: %s", e)
             return None
 
     def scan_stream(
@@ -82,6 +198,9 @@ class ClamAVClient:
         """
         Scan a file from a file-like object.
 
+        The file is streamed to clamd and hashed in a single pass, without
+        being read into memory first.
+
         Args:
             file_obj: File-like object containing file content
             filename: Original filename for the result
@@ -91,7 +210,7 @@ class ClamAVClient:
         """
         if not self.client:
             return (
-                FileScanResult(
+                FileScanResult.model_construct(
                     filename=filename,
                     size_bytes=0,
                     sha256_hash="",
@@ -103,7 +222,7 @@ class ClamAVClient:
                 "ClamAV client not connected",
             )
 
-        start_time = time()
+        start_time = perf_counter()
         sha256_hash = ""
         file_size = 0
         status = "clean"
@@ -111,39 +230,144 @@ class ClamAVClient:
         error_message = None
 
         try:
-            # Read file content and calculate hash
-            file_content = file_obj.read()
-            file_size = len(file_content)
+            # Scan the file, hashing it as clamd reads it
+            reader = HashingReader(file_obj)
+            scan_result = self.client.instream(reader)
 
-            # Calculate SHA256
-            sha256_hash = hashlib.sha256(file_content).hexdigest()
+            # clamd returns: {'path': (status, reason)}, with status "OK" for
+            # clean streams, "FOUND" for infected ones and "ERROR" when the
+            # scan itself failed
+            if scan_result:
+                for path, (detected_status, reason) in scan_result.items():
+                    if detected_status == "FOUND":
+                        # File is infected
+                        status = "infected"
+                        virus_signature = reason
+                        break
+                    if detected_status == "ERROR":
+                        raise clamd.ResponseError(reason)
 
-            # Scan the file
-            stream = io.BytesIO(file_content)
-            scan_result = self.client.instream(stream)
+            file_size = reader.size
+            sha256_hash = reader.sha256.hexdigest()
 
-            if scan_result is None:
-                # File is clean
-                status = "clean"
-            else:
-                # File is infected
+        except Exception as e:
+            error_message = str(e)
+            status = "error"
+            logger.error("Error scanning file %s: %s", filename, e)
+
+        scan_time = perf_counter() - start_time
+
+        result = FileScanResult.model_construct(
+            filename=filename,
+            size_bytes=file_size,
+            sha256_hash=sha256_hash,
+            status=status,
+            virus_signature=virus_signature,
+            scan_time_seconds=round(scan_time, 2),
+            timestamp=datetime.utcnow(),
+        )
+
+        return result, error_message
+
+    async def _open_instream(self) -> Tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+        """Open an asyncio connection to clamd and start an INSTREAM session."""
+        if self.connection_type == "unix":
+            connection = asyncio.open_unix_connection(settings.clamav_unix_socket)
+        else:
+            connection = asyncio.open_connection(settings.clamav_host, settings.clamav_port)
+        reader, writer = await asyncio.wait_for(connection, settings.clamav_timeout)
+
+        writer.get_extra_info("socket").setsockopt(
+            socket.SOL_SOCKET, socket.SO_SNDBUF, settings.clamav_socket_send_buffer
+        )
+        writer.write(b"zINSTREAM\0")
+        return reader, writer
+
+    async def scan_stream_async(
+        self, chunks: AsyncIterable[bytes], filename: str
+    ) -> Tuple[FileScanResult, Optional[str]]:
+        """
+        Scan a file given as an async stream of chunks.
+
+        Speaks clamd's INSTREAM protocol over an asyncio connection, so a
+        scan holds no worker thread while it waits on the network. The data
+        is hashed in the same pass.
+
+        Args:
+            chunks: Async iterable of the file's content
+            filename: Original filename for the result
+
+        Returns:
+            Tuple of (FileScanResult, error_message)
+        """
+        if not self.client:
+            return (
+                FileScanResult.model_construct(
+                    filename=filename,
+                    size_bytes=0,
+                    sha256_hash="",
+                    status="error",
+                    virus_signature=None,
+                    scan_time_seconds=0,
+                    timestamp=datetime.utcnow(),
+                ),
+                "ClamAV client not connected",
+            )
+
+        start_time = perf_counter()
+        sha256 = hashlib.sha256(usedforsecurity=False)
+        streamed = 0
+        sha256_hash = ""
+        file_size = 0
+        status = "clean"
+        virus_signature = None
+        error_message = None
+        writer = None
+
+        try:
+            reader, writer = await self._open_instream()
+
+            chunk_size = settings.clamav_chunk_size
+            async for data in chunks:
+                sha256.update(data)
+                streamed += len(data)
+                view = memoryview(data)
+                for offset in range(0, len(view), chunk_size):
+                    chunk = view[offset : offset + chunk_size]
+                    writer.write(struct.pack("!L", len(chunk)))
+                    writer.write(chunk)
+                await writer.drain()
+
+            writer.write(struct.pack("!L", 0))
+            await writer.drain()
+
+            reply = await asyncio.wait_for(reader.readuntil(b"\0"), settings.clamav_timeout)
+            reply = reply.rstrip(b"\0").decode("utf-8", "replace")
+            if reply == "INSTREAM size limit exceeded. ERROR":
+                raise clamd.BufferTooLongError(reply)
+
+            _, reason, detected_status = self.client._parse_response(reply)
+            if detected_status == "FOUND":
                 status = "infected"
-                # Extract virus signature from result
-                # clamd returns: {'path': (status, virus_name)}
-                if isinstance(scan_result, dict):
-                    for path, (detected_status, virus_name) in scan_result.items():
-                        if virus_name:
-                            virus_signature = virus_name
-                            break
+                virus_signature = reason
+            elif detected_status == "ERROR":
+                raise clamd.ResponseError(reason)
+
+            # Only a fully streamed file has a meaningful size and hash
+            file_size = streamed
+            sha256_hash = sha256.hexdigest()
 
         except Exception as e:
             error_message = str(e)
             status = "error"
-            logger.error(f"Error scanning file {filename}: {e}")
+            logger.error("Error scanning file %s: %s", filename, e)
+        finally:
+            if writer:
+                writer.close()
 
-        scan_time = time() - start_time
+        scan_time = perf_counter() - start_time
 
-        result = FileScanResult(
+        result = FileScanResult.model_construct(
             filename=filename,
             size_bytes=file_size,
             sha256_hash=sha256_hash,
@@ -158,6 +382,8 @@ class ClamAVClient:
     def disconnect(self):
         """Disconnect from ClamAV daemon."""
         self.client = None
+        self._version_cache = None
+        self._ping_cache = None
         logger.info("Disconnected from ClamAV")
 
 
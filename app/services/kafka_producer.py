@@ -1,28 +1,71 @@
 import asyncio
-import json
 import logging
-from typing import Any, Optional, Set
+from functools import partial
+from time import monotonic
+from typing import Any, Optional, Set, Union
 
+import orjson
 from aiokafka import AIOKafkaProducer
-from aiokafka.admin import AIOKafkaAdminClient
 
 from app.config import settings
 
 logger = logging.getLogger(__name__)
 
+# How long disconnect() waits for queued results to reach the producer
+QUEUE_DRAIN_TIMEOUT = 10.0
+
+# How long the list of topics is trusted before it's fetched again
+TOPICS_CACHE_TTL = 30.0
+
+# Minimum time between refreshes triggered by an unknown topic
+MISSING_TOPIC_REFRESH_INTERVAL = 5.0
+
 
 class TopicNotFoundError(Exception):
     """Raised when a Kafka topic does not exist"""
     pass
 
 
+def _serialize_value(value: Union[bytes, dict[str, Any]]) -> bytes:
+    """Encode a result dict as JSON, passing pre-encoded payloads through."""
+    if isinstance(value, bytes):
+        return value
+    return orjson.dumps(value)
+
+
+def _serialize_key(key: Union[bytes, str]) -> bytes:
+    """Encode a message key if it's a string."""
+    return key.encode("utf-8") if isinstance(key, str) else key
+
+
+def _message_key(result: Union[bytes, dict[str, Any]], key: Optional[str]) -> str:
+    """Use the result's request_id as the message key if none is given."""
+    if key is None:
+        key = result.get("request_id", "default") if isinstance(result, dict) else "default"
+    return key
+
+
+def _log_delivery(topic: str, key: str, delivery: asyncio.Future):
+    """Log the outcome of a queued result's delivery once the broker answers."""
+    if delivery.cancelled():
+        return
+    error = delivery.exception()
+    if error:
+        logger.error("Failed to send to Kafka topic %s: %s", topic, error)
+    else:
+        logger.info("Sent scan result to Kafka topic %s with key %s", topic, key)
+
+
 class KafkaProducerClient:
     """Kafka producer client for sending scan results"""
 
     def __init__(self):
         self.producer: Optional[AIOKafkaProducer] = None
-        self.admin_client: Optional[AIOKafkaAdminClient] = None
         self._topics_cache: Set[str] = set()
+        self._topics_cache_ts: float = float("-inf")
+        self._topics_refresh_lock = asyncio.Lock()
+        self._queue: Optional[asyncio.Queue] = None
+        self._sender: Optional[asyncio.Task] = None
 
     async def connect(self) -> bool:
         """
@@ -33,73 +76,111 @@ class KafkaProducerClient:
         try:
             self.producer = AIOKafkaProducer(
                 bootstrap_servers=settings.kafka_bootstrap_servers,
-                value_serializer=lambda v: json.dumps(v, default=str).encode("utf-8"),
+                key_serializer=_serialize_key,
+                value_serializer=_serialize_value,
+                # Hold messages for up to linger_ms so bursts of results share
+                # one produce request; larger values trade latency for batching.
+                linger_ms=settings.kafka_linger_ms,
+                max_batch_size=settings.kafka_max_batch_size,
+                acks=settings.kafka_acks,
+                # Batches are compressed as a whole; consumers decompress transparently
+                compression_type=settings.kafka_compression_type or None,
             )
             await self.producer.start()
 
-            # Initialize admin client for topic validation
-            self.admin_client = AIOKafkaAdminClient(
-                bootstrap_servers=settings.kafka_bootstrap_servers,
-            )
-            await self.admin_client.start()
-
             # Refresh topics cache
             await self._refresh_topics_cache()
 
+            # Start the background sender for enqueued results
+            self._queue = asyncio.Queue()
+            self._sender = asyncio.create_task(self._send_queued_results())
+
             logger.info(f"Connected to Kafka at {settings.kafka_bootstrap_servers}")
             return True
         except Exception as e:
-            logger.error(f"Failed to connect to Kafka: {e}")
+            logger.error("Failed to connect to Kafka: %s", e)
             self.producer = None
-            self.admin_client = None
             return False
 
     async def _refresh_topics_cache(self):
-        """Refresh the cached list of topics."""
-        if self.admin_client:
+        """
+        Refresh the cached list of topics.
+
+        The cluster metadata is fetched over the producer's own broker
+        connection, so no separate admin client is needed.
+        """
+        if self.producer:
             try:
-                topics = await self.admin_client.list_topics()
-                self._topics_cache = set(topics)
-                logger.debug(f"Refreshed topics cache: {self._topics_cache}")
+                cluster = await self.producer.client.fetch_all_metadata()
+                self._topics_cache = cluster.topics()
+                logger.debug("Refreshed topics cache: %s", self._topics_cache)
             except Exception as e:
-                logger.error(f"Failed to refresh topics cache: {e}")
+                logger.error("Failed to refresh topics cache: %s", e)
+            # Failed refreshes are throttled too, so an unreachable cluster
+            # isn't queried on every request
+            self._topics_cache_ts = monotonic()
 
     async def topic_exists(self, topic: str) -> bool:
         """
         Check if a Kafka topic exists.
 
+        Topics the producer already tracks are answered from its own cluster
+        metadata. The full list of topics is cached for TOPICS_CACHE_TTL
+        seconds, and an unknown topic refreshes it at most every
+        MISSING_TOPIC_REFRESH_INTERVAL seconds, so repeated requests for a
+        missing topic don't each cost a metadata round-trip.
+
         Args:
             topic: Topic name to check
 
         Returns:
             True if topic exists, False otherwise
         """
-        # First check cache
-        if topic in self._topics_cache:
+        age = monotonic() - self._topics_cache_ts
+        if topic in self._topics_cache and age < TOPICS_CACHE_TTL:
+            return True
+        # The producer keeps metadata for the topics it sends to up to date
+        # itself, so those need no fetch of our own
+        if self.producer and topic in self.producer.client.cluster.topics():
             return True
+        if age < MISSING_TOPIC_REFRESH_INTERVAL:
+            return topic in self._topics_cache
 
-        # Refresh cache and check again
-        await self._refresh_topics_cache()
+        async with self._topics_refresh_lock:
+            # Another request may have refreshed the cache while we waited
+            if monotonic() - self._topics_cache_ts >= MISSING_TOPIC_REFRESH_INTERVAL:
+                await self._refresh_topics_cache()
         return topic in self._topics_cache
 
     async def disconnect(self):
         """Disconnect from Kafka."""
-        if self.admin_client:
-            await self.admin_client.close()
-            self.admin_client = None
+        if self._sender:
+            try:
+                await asyncio.wait_for(self._queue.join(), QUEUE_DRAIN_TIMEOUT)
+            except asyncio.TimeoutError:
+                logger.warning("Dropping %s unsent Kafka results", self._queue.qsize())
+            self._sender.cancel()
+            self._sender = None
+            self._queue = None
         if self.producer:
             await self.producer.stop()
             self.producer = None
         self._topics_cache.clear()
+        self._topics_cache_ts = float("-inf")
         logger.info("Disconnected from Kafka")
 
-    async def send_result(self, topic: str, result: dict[str, Any], key: Optional[str] = None) -> bool:
+    async def send_result(
+        self,
+        topic: str,
+        result: Union[bytes, dict[str, Any]],
+        key: Optional[str] = None,
+    ) -> bool:
         """
         Send scan result to Kafka topic.
 
         Args:
             topic: Kafka topic name
-            result: Scan result dictionary
+            result: Scan result dictionary, or its already JSON-encoded bytes
             key: Optional message key for partitioning (uses request_id if available)
 
         Returns:
@@ -116,21 +197,71 @@ class KafkaProducerClient:
         if not await self.topic_exists(topic):
             raise TopicNotFoundError(f"Kafka topic '{topic}' does not exist")
 
-        # Use request_id as key if not provided
-        if key is None:
-            key = result.get("request_id", "default")
-
-        # Encode key if it's a string
-        message_key = key.encode("utf-8") if isinstance(key, str) else key
+        key = _message_key(result, key)
 
         try:
-            await self.producer.send_and_wait(topic, value=result, key=message_key)
-            logger.info(f"Sent scan result to Kafka topic {topic} with key {key}")
+            await self.producer.send_and_wait(topic, value=result, key=key)
+            logger.info("Sent scan result to Kafka topic %s with key %s", topic, key)
             return True
         except Exception as e:
-            logger.error(f"Failed to send to Kafka topic {topic}: {e}")
+            logger.error("Failed to send to Kafka topic %s: %s", topic, e)
             return False
 
+    def enqueue_result(
+        self, topic: str, result: Union[bytes, dict[str, Any]], key: Optional[str] = None
+    ) -> bool:
+        """
+        Queue a scan result to be sent to Kafka in the background.
+
+        Queued results are handed to the producer in batches without waiting
+        for each delivery, so a burst of scans shares produce requests
+        instead of paying a broker round-trip each. The topic is not
+        validated here; callers check it before scanning.
+
+        Args:
+            topic: Kafka topic name
+            result: Scan result dictionary, or its already JSON-encoded bytes
+            key: Optional message key for partitioning (uses request_id if available)
+
+        Returns:
+            True if the result was queued, False if the producer is not connected
+        """
+        if not self.producer or self._queue is None:
+            logger.error("Kafka producer not connected")
+            return False
+
+        self._queue.put_nowait((topic, result, key))
+        return True
+
+    async def _send_queued_results(self):
+        """Send enqueued results in batches until cancelled."""
+        while True:
+            batch = [await self._queue.get()]
+            while not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+
+            try:
+                await self._send_batch(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    async def _send_batch(self, batch):
+        """
+        Append a batch of results to the producer.
+
+        Deliveries aren't awaited: each one logs its own outcome when the
+        broker answers, so the next batch can be appended while this one is
+        still in flight. producer.stop() flushes whatever is pending.
+        """
+        for topic, result, key in batch:
+            key = _message_key(result, key)
+            try:
+                delivery = await self.producer.send(topic, value=result, key=key)
+                delivery.add_done_callback(partial(_log_delivery, topic, key))
+            except Exception as e:
+                logger.error("Failed to send to Kafka topic %s: %s", topic, e)
+
 
 # Global Kafka producer instance
 kafka_producer = KafkaProducerClient()
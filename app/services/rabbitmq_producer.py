@@ -1,60 +1,97 @@
-import json
+import asyncio
 import logging
-from typing import Any, Dict
+from typing import Any, Dict, Optional, Union
 
-import pika
-from pika.exceptions import AMQPError
+import aio_pika
+import lz4.frame
+import orjson
+from aio_pika.abc import AbstractRobustChannel, AbstractRobustConnection
+from aio_pika.exceptions import AMQPException
 
 from app.config import settings
 
 logger = logging.getLogger(__name__)
 
+# How long disconnect() waits for queued results to be published
+QUEUE_DRAIN_TIMEOUT = 10.0
+
+
+def _build_message(result: Union[bytes, Dict[str, Any]]) -> aio_pika.Message:
+    """
+    Wrap a scan result in a persistent JSON message.
+
+    With RABBITMQ_COMPRESSION the body is an LZ4 frame and content_encoding
+    is set to "lz4"; consumers must decompress before parsing the JSON.
+    """
+    body = result if isinstance(result, bytes) else orjson.dumps(result)
+    content_encoding = None
+    if settings.rabbitmq_compression:
+        body = lz4.frame.compress(body)
+        content_encoding = "lz4"
+    return aio_pika.Message(
+        body=body,
+        delivery_mode=aio_pika.DeliveryMode.PERSISTENT,
+        content_type="application/json",
+        content_encoding=content_encoding,
+    )
+
 
 class RabbitMQProducer:
     """RabbitMQ producer for publishing scan results"""
 
     def __init__(self):
-        self.connection = None
-        self.channel = None
+        self.connection: Optional[AbstractRobustConnection] = None
+        self.channel: Optional[AbstractRobustChannel] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._publisher: Optional[asyncio.Task] = None
 
-    def connect(self) -> bool:
+    async def connect(self) -> bool:
         """
         Establish connection to RabbitMQ.
 
         Returns True if successful, False otherwise.
         """
         try:
-            credentials = pika.PlainCredentials(
-                settings.rabbitmq_user,
-                settings.rabbitmq_password,
+            self.connection = await aio_pika.connect_robust(
+                host=settings.rabbitmq_host,
+                port=settings.rabbitmq_port,
+                login=settings.rabbitmq_user,
+                password=settings.rabbitmq_password,
             )
-            self.connection = pika.BlockingConnection(
-                pika.ConnectionParameters(
-                    host=settings.rabbitmq_host,
-                    port=settings.rabbitmq_port,
-                    credentials=credentials,
-                    connection_attempts=3,
-                    retry_delay=2,
-                )
-            )
-            self.channel = self.connection.channel()
+            # With publisher confirms, a publish completes once the broker
+            # has taken responsibility for the message
+            self.channel = await self.connection.channel(publisher_confirms=True)
+
+            # Start the background publisher for enqueued results
+            self._queue = asyncio.Queue()
+            self._publisher = asyncio.create_task(self._publish_queued_results())
             logger.info(
                 f"Connected to RabbitMQ at {settings.rabbitmq_host}:{settings.rabbitmq_port}"
             )
             return True
         except Exception as e:
-            logger.error(f"Failed to connect to RabbitMQ: {e}")
+            logger.error("Failed to connect to RabbitMQ: %s", e)
             self.connection = None
             self.channel = None
             return False
 
-    def disconnect(self):
+    async def disconnect(self):
         """Disconnect from RabbitMQ."""
+        if self._publisher:
+            try:
+                await asyncio.wait_for(self._queue.join(), QUEUE_DRAIN_TIMEOUT)
+            except asyncio.TimeoutError:
+                logger.warning("Dropping %s unpublished RabbitMQ results", self._queue.qsize())
+            self._publisher.cancel()
+            self._publisher = None
+            self._queue = None
         if self.connection and not self.connection.is_closed:
-            self.connection.close()
+            await self.connection.close()
             logger.info("Disconnected from RabbitMQ")
+        self.connection = None
+        self.channel = None
 
-    def declare_queue(self, queue_name: str = None) -> bool:
+    async def declare_queue(self, queue_name: str = None) -> bool:
         """
         Declare a queue (creates it if it doesn't exist).
 
@@ -71,24 +108,24 @@ class RabbitMQProducer:
         queue_name = queue_name or settings.rabbitmq_queue
 
         try:
-            self.channel.queue_declare(queue=queue_name, durable=True)
-            logger.info(f"Declared queue: {queue_name}")
+            await self.channel.declare_queue(queue_name, durable=True)
+            logger.info("Declared queue: %s", queue_name)
             return True
-        except AMQPError as e:
-            logger.error(f"Failed to declare queue {queue_name}: {e}")
+        except AMQPException as e:
+            logger.error("Failed to declare queue %s: %s", queue_name, e)
             return False
         except Exception as e:
-            logger.error(f"Unexpected error declaring queue {queue_name}: {e}")
+            logger.error("Unexpected error declaring queue %s: %s", queue_name, e)
             return False
 
     async def send_result(
-        self, result: Dict[str, Any], queue_name: str = None
+        self, result: Union[bytes, Dict[str, Any]], queue_name: str = None
     ) -> bool:
         """
         Publish scan result to RabbitMQ queue.
 
         Args:
-            result: Scan result dictionary
+            result: Scan result dictionary, or its already JSON-encoded bytes
             queue_name: Queue name (defaults to configured queue)
 
         Returns:
@@ -101,25 +138,77 @@ class RabbitMQProducer:
         queue_name = queue_name or settings.rabbitmq_queue
 
         try:
-            message = json.dumps(result)
-            self.channel.basic_publish(
-                exchange="",
-                routing_key=queue_name,
-                body=message,
-                properties=pika.BasicProperties(
-                    delivery_mode=pika.DeliveryMode.Persistent,
-                    content_type="application/json",
-                ),
+            await self.channel.default_exchange.publish(
+                _build_message(result), routing_key=queue_name
             )
-            logger.info(f"Published scan result to queue: {queue_name}")
+            logger.info("Published scan result to queue: %s", queue_name)
             return True
-        except AMQPError as e:
-            logger.error(f"Failed to publish message to {queue_name}: {e}")
+        except AMQPException as e:
+            logger.error("Failed to publish message to %s: %s", queue_name, e)
             return False
         except Exception as e:
-            logger.error(f"Unexpected error publishing to {queue_name}: {e}")
+            logger.error("Unexpected error publishing to %s: %s", queue_name, e)
             return False
 
+    def enqueue_result(
+        self, result: Union[bytes, Dict[str, Any]], queue_name: str = None
+    ) -> bool:
+        """
+        Queue a scan result to be published to RabbitMQ in the background.
+
+        Results arriving within RABBITMQ_LINGER_MS of each other are published
+        together and their confirms awaited as one batch, instead of one
+        broker round-trip per result.
+
+        Args:
+            result: Scan result dictionary, or its already JSON-encoded bytes
+            queue_name: Queue name (defaults to configured queue)
+
+        Returns:
+            True if the result was queued, False if the channel is not connected
+        """
+        if not self.channel or self._queue is None:
+            logger.error("RabbitMQ channel not connected")
+            return False
+
+        self._queue.put_nowait((result, queue_name or settings.rabbitmq_queue))
+        return True
+
+    async def _publish_queued_results(self):
+        """Publish enqueued results in batches until cancelled."""
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + settings.rabbitmq_linger_ms / 1000
+            while (timeout := deadline - loop.time()) > 0:
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            try:
+                await self._publish_batch(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    async def _publish_batch(self, batch):
+        """Publish a batch of results and wait for their confirms."""
+        outcomes = await asyncio.gather(
+            *(
+                self.channel.default_exchange.publish(
+                    _build_message(result), routing_key=queue_name
+                )
+                for result, queue_name in batch
+            ),
+            return_exceptions=True,
+        )
+        for (_, queue_name), outcome in zip(batch, outcomes):
+            if isinstance(outcome, Exception):
+                logger.error("Failed to publish message to %s: %s", queue_name, outcome)
+            else:
+                logger.info("Published scan result to queue: %s", queue_name)
+
 
 # Global RabbitMQ producer instance
 rabbitmq_producer = RabbitMQProducer()
@@ -1,7 +1,11 @@
+import base64
 import logging
+from contextlib import AsyncExitStack
 from typing import Optional
 
-import boto3
+from aiobotocore.config import AioConfig
+from aiobotocore.response import StreamingBody
+from aiobotocore.session import get_session
 from botocore.exceptions import ClientError
 
 from app.config import settings
@@ -14,35 +18,52 @@ class S3Client:
 
     def __init__(self):
         self.client = None
+        self._exit_stack: Optional[AsyncExitStack] = None
 
-    def connect(self) -> bool:
+    async def connect(self) -> bool:
         """
         Establish connection to S3/MinIO.
 
+        Uses aiobotocore, so requests are awaited on the event loop and
+        share one pool of keep-alive connections.
+
         Returns True if successful, False otherwise.
         """
+        self._exit_stack = AsyncExitStack()
         try:
-            self.client = boto3.client(
-                "s3",
-                endpoint_url=settings.s3_endpoint,
-                aws_access_key_id=settings.s3_access_key,
-                aws_secret_access_key=settings.s3_secret_key,
+            self.client = await self._exit_stack.enter_async_context(
+                get_session().create_client(
+                    "s3",
+                    endpoint_url=settings.s3_endpoint,
+                    aws_access_key_id=settings.s3_access_key,
+                    aws_secret_access_key=settings.s3_secret_key,
+                    config=AioConfig(
+                        max_pool_connections=settings.s3_max_pool_connections,
+                        connect_timeout=settings.s3_connect_timeout,
+                        read_timeout=settings.s3_read_timeout,
+                    ),
+                )
             )
             # Test connection by listing buckets
-            self.client.list_buckets()
+            await self.client.list_buckets()
             logger.info(f"Connected to S3 at {settings.s3_endpoint}")
             return True
         except Exception as e:
-            logger.error(f"Failed to connect to S3: {e}")
+            logger.error("Failed to connect to S3: %s", e)
+            await self._exit_stack.aclose()
+            self._exit_stack = None
             self.client = None
             return False
 
-    def disconnect(self):
+    async def disconnect(self):
         """Disconnect from S3."""
+        if self._exit_stack:
+            await self._exit_stack.aclose()
+            self._exit_stack = None
         self.client = None
         logger.info("Disconnected from S3")
 
-    def file_exists(self, key: str, bucket: Optional[str] = None) -> bool:
+    async def file_exists(self, key: str, bucket: Optional[str] = None) -> bool:
         """
         Check if a file exists in S3 bucket.
 
@@ -60,30 +81,76 @@ class S3Client:
         bucket = bucket or settings.s3_bucket
 
         try:
-            self.client.head_object(Bucket=bucket, Key=key)
-            logger.info(f"File {key} exists in bucket {bucket}")
+            await self.client.head_object(Bucket=bucket, Key=key)
+            logger.info("File %s exists in bucket %s", key, bucket)
             return True
         except ClientError as e:
             error_code = e.response.get("Error", {}).get("Code", "Unknown")
             if error_code == "404" or error_code == "NotFound":
-                logger.warning(f"File {key} not found in bucket {bucket}")
+                logger.warning("File %s not found in bucket %s", key, bucket)
             else:
-                logger.error(f"Error checking file {key} in {bucket}: {error_code} - {e}")
+                logger.error("Error checking file %s in %s: %s - %s", key, bucket, error_code, e)
             return False
         except Exception as e:
-            logger.error(f"Unexpected error checking file {key}: {e}")
+            logger.error("Unexpected error checking file %s: %s", key, e)
             return False
 
-    def download_file(self, key: str, bucket: Optional[str] = None) -> Optional[bytes]:
+    async def head_object(self, key: str, bucket: Optional[str] = None) -> Optional[dict]:
+        """
+        Fetch object metadata without downloading the body.
+
+        Args:
+            key: S3 object key
+            bucket: Bucket name (defaults to configured bucket)
+
+        Returns:
+            Dict with "etag", "version_id", "size" and "sha256" (hex digest of
+            the whole object, or None when S3 has no full-object checksum),
+            or None if failed
+        """
+        if not self.client:
+            logger.error("S3 client not connected")
+            return None
+
+        bucket = bucket or settings.s3_bucket
+
+        try:
+            response = await self.client.head_object(
+                Bucket=bucket, Key=key, ChecksumMode="ENABLED"
+            )
+        except ClientError as e:
+            error_code = e.response.get("Error", {}).get("Code", "Unknown")
+            logger.error("Failed to get metadata for %s in %s: %s - %s", key, bucket, error_code, e)
+            return None
+        except Exception as e:
+            logger.error("Unexpected error getting metadata for %s: %s", key, e)
+            return None
+
+        # Multipart uploads report a checksum of part checksums ("<b64>-<parts>"),
+        # which is not the SHA-256 of the object itself
+        checksum = response.get("ChecksumSHA256")
+        sha256_hash = None
+        if checksum and "-" not in checksum:
+            sha256_hash = base64.b64decode(checksum).hex()
+
+        return {
+            "etag": response.get("ETag", "").strip('"'),
+            "version_id": response.get("VersionId"),
+            "size": response.get("ContentLength", 0),
+            "sha256": sha256_hash,
+        }
+
+    async def open_stream(self, key: str, bucket: Optional[str] = None) -> Optional[StreamingBody]:
         """
-        Download file from S3 bucket.
+        Open an S3 object for streaming reads.
 
         Args:
             key: S3 object key
             bucket: Bucket name (defaults to configured bucket)
 
         Returns:
-            File content as bytes, or None if failed
+            The object's async streaming body (the caller must close it, e.g. with
+            "async with"), or None if failed
         """
         if not self.client:
             logger.error("S3 client not connected")
@@ -92,16 +159,17 @@ class S3Client:
         bucket = bucket or settings.s3_bucket
 
         try:
-            response = self.client.get_object(Bucket=bucket, Key=key)
-            content = response["Body"].read()
-            logger.info(f"Downloaded file {key} from bucket {bucket} ({len(content)} bytes)")
-            return content
+            response = await self.client.get_object(Bucket=bucket, Key=key)
+            logger.info(
+                "Opened file %s from bucket %s (%s bytes)", key, bucket, response['ContentLength']
+            )
+            return response["Body"]
         except ClientError as e:
             error_code = e.response.get("Error", {}).get("Code", "Unknown")
-            logger.error(f"Failed to download {key} from {bucket}: {error_code} - {e}")
+            logger.error("Failed to download %s from %s: %s - %s", key, bucket, error_code, e)
             return None
         except Exception as e:
-            logger.error(f"Unexpected error downloading {key}: {e}")
+            logger.error("Unexpected error downloading %s: %s", key, e)
             return None
 
 
@@ -1,12 +1,17 @@
 import io
+from datetime import datetime
 from unittest.mock import MagicMock, patch
 
 import pytest
 from fastapi.testclient import TestClient
 
 from app.main import app
+from app.models import FileScanResult
 from app.services.clamav_client import ClamAVClient
 
+# The EICAR test signature - a standard antivirus test pattern, NOT a real virus
+EICAR = b"X5O!P%@AP[4\\PZX54(P^)7CC)7}$EICAR-STANDARD-ANTIVIRUS-TEST-FILE!$H+H*"
+
 
 @pytest.fixture
 def test_client():
@@ -37,13 +42,60 @@ def sample_eicar_file():
     Create the EICAR test file - a standard antivirus test signature.
     This is NOT a real virus, it's an industry-standard test pattern.
     """
-    eicar = b"X5O!P%@AP[4\\PZX54(P^)7CC)7}$EICAR-STANDARD-ANTIVIRUS-TEST-FILE!$H+H*"
-    return io.BytesIO(eicar)
+    return io.BytesIO(EICAR)
+
+
+@pytest.fixture(scope="session")
+def large_content():
+    """Content larger than the max allowed size, allocated once per session."""
+    # 101 MB file (default max is 100 MB)
+    return b"x" * (101 * 1024 * 1024)
 
 
 @pytest.fixture
-def large_file():
+def large_file(large_content):
     """Create a file larger than the max allowed size."""
-    # 101 MB file (default max is 100 MB)
-    content = b"x" * (101 * 1024 * 1024)
-    return io.BytesIO(content)
+    # BytesIO shares the bytes until written to, so this doesn't copy them
+    return io.BytesIO(large_content)
+
+
+@pytest.fixture(scope="session")
+def clean_result():
+    """A clean scan result, as returned by ClamAVClient.scan_stream."""
+    return FileScanResult.model_construct(
+        filename="test.txt",
+        size_bytes=1024,
+        sha256_hash="abc123",
+        status="clean",
+        virus_signature=None,
+        scan_time_seconds=0.1,
+        timestamp=datetime.utcnow(),
+    )
+
+
+@pytest.fixture(scope="session")
+def infected_result():
+    """An infected scan result, as returned by ClamAVClient.scan_stream."""
+    return FileScanResult.model_construct(
+        filename="malware.exe",
+        size_bytes=2048,
+        sha256_hash="def456",
+        status="infected",
+        virus_signature="Win.Test.EICAR_HDB-1",
+        scan_time_seconds=0.2,
+        timestamp=datetime.utcnow(),
+    )
+
+
+@pytest.fixture(scope="session")
+def error_result():
+    """A failed scan result, as returned by ClamAVClient.scan_stream."""
+    return FileScanResult.model_construct(
+        filename="error.bin",
+        size_bytes=0,
+        sha256_hash="",
+        status="error",
+        virus_signature=None,
+        scan_time_seconds=0,
+        timestamp=datetime.utcnow(),
+    )
@@ -1,20 +1,78 @@
+import asyncio
+import hashlib
 import io
-from unittest.mock import MagicMock, patch
+import threading
+import time
+from unittest.mock import AsyncMock, MagicMock, patch
 from datetime import datetime
 
+import httpx
 import pytest
+from fastapi.responses import ORJSONResponse
 from fastapi.testclient import TestClient
 
-from app.main import app
+from app.main import UVICORN_OPTIONS, app
 from app.models import FileScanResult
 
 
-@pytest.fixture
+class ScanTracker:
+    """
+    Stand-in for scan_stream that records how many scans overlap.
+
+    Each scan sleeps briefly so concurrent scans have a chance to overlap,
+    and peak holds the most that were ever in flight at once.
+    """
+
+    def __init__(self, result, delay=0.05):
+        self.result = result
+        self.delay = delay
+        self.in_flight = 0
+        self.peak = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, file_obj, filename):
+        with self.lock:
+            self.in_flight += 1
+            self.peak = max(self.peak, self.in_flight)
+        try:
+            time.sleep(self.delay)
+            return self.result, None
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+
+
+@pytest.fixture(scope="module")
 def client():
-    """Create test client."""
+    """
+    Create one test client for the module.
+
+    It is not entered with "with", so the app's lifespan never runs and the
+    tests don't try to reach ClamAV, Redis or the brokers.
+    """
     return TestClient(app)
 
 
+@pytest.fixture
+def aclient():
+    """
+    Create an async client that calls the app directly on the test's event loop.
+
+    Unlike TestClient, concurrent requests aren't funnelled through a
+    blocking portal, so tests can measure how the app handles concurrency.
+    Enter it with "async with" inside asyncio.run().
+    """
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test")
+
+
+@pytest.fixture(autouse=True)
+def mock_client(monkeypatch):
+    """Replace the router's ClamAV client with a mock for every test."""
+    mock = MagicMock()
+    monkeypatch.setattr("app.routers.scan.clamav_client", mock)
+    return mock
+
+
 class TestRootEndpoint:
     def test_root_returns_api_info(self, client):
         response = client.get("/")
@@ -25,8 +83,16 @@ class TestRootEndpoint:
         assert "endpoints" in data
 
 
+class TestAppConfig:
+    def test_default_response_class_is_orjson(self):
+        assert app.router.default_response_class is ORJSONResponse
+
+    def test_served_with_uvloop_and_httptools(self):
+        assert UVICORN_OPTIONS["loop"] == "uvloop"
+        assert UVICORN_OPTIONS["http"] == "httptools"
+
+
 class TestHealthEndpoint:
-    @patch("app.routers.scan.clamav_client")
     def test_health_check_healthy(self, mock_client, client):
         mock_client.ping.return_value = True
 
@@ -35,7 +101,6 @@ class TestHealthEndpoint:
         data = response.json()
         assert data["status"] == "healthy"
 
-    @patch("app.routers.scan.clamav_client")
     def test_health_check_unhealthy(self, mock_client, client):
         mock_client.ping.return_value = False
 
@@ -44,7 +109,6 @@ class TestHealthEndpoint:
 
 
 class TestVersionEndpoint:
-    @patch("app.routers.scan.clamav_client")
     def test_version_returns_versions(self, mock_client, client):
         mock_client.get_version.return_value = "ClamAV 1.0.0"
 
@@ -55,7 +119,6 @@ class TestVersionEndpoint:
         assert "clamav_version" in data
         assert data["clamav_version"] == "ClamAV 1.0.0"
 
-    @patch("app.routers.scan.clamav_client")
     def test_version_unavailable(self, mock_client, client):
         mock_client.get_version.return_value = None
 
@@ -64,90 +127,150 @@ class TestVersionEndpoint:
 
 
 class TestScanEndpoint:
-    @patch("app.routers.scan.clamav_client")
-    def test_scan_single_clean_file(self, mock_client, client):
+    @pytest.mark.parametrize(
+        "result_fixture, error, count_key",
+        [
+            ("clean_result", None, "clean_files"),
+            ("infected_result", None, "infected_files"),
+            ("error_result", "Scan error occurred", "error_files"),
+        ],
+    )
+    def test_scan_single_file(
+        self, mock_client, client, request, result_fixture, error, count_key
+    ):
+        result = request.getfixturevalue(result_fixture)
         mock_client.client = MagicMock()
-        mock_client.scan_stream.return_value = (
-            FileScanResult(
-                filename="test.txt",
-                size_bytes=1024,
-                sha256_hash="abc123",
-                status="clean",
-                virus_signature=None,
-                scan_time_seconds=0.1,
-                timestamp=datetime.utcnow(),
-            ),
-            None,
-        )
+        mock_client.scan_stream.return_value = (result, error)
 
-        files = {"files": ("test.txt", b"clean content", "text/plain")}
+        files = {"files": (result.filename, b"file content", "application/octet-stream")}
         response = client.post("/api/v1/scan", files=files)
 
         assert response.status_code == 200
         data = response.json()
         assert data["total_files"] == 1
-        assert data["clean_files"] == 1
-        assert data["infected_files"] == 0
+        assert data[count_key] == 1
+        assert data["results"][0]["status"] == result.status
+        assert data["results"][0]["virus_signature"] == result.virus_signature
 
-    @patch("app.routers.scan.clamav_client")
-    def test_scan_infected_file(self, mock_client, client):
+    def test_scan_multiple_files(self, mock_client, client, clean_result):
         mock_client.client = MagicMock()
-        mock_client.scan_stream.return_value = (
-            FileScanResult(
-                filename="malware.exe",
-                size_bytes=2048,
-                sha256_hash="def456",
-                status="infected",
-                virus_signature="Win.Test.EICAR_HDB-1",
-                scan_time_seconds=0.2,
-                timestamp=datetime.utcnow(),
-            ),
-            None,
-        )
+        mock_client.scan_stream.return_value = (clean_result, None)
 
-        files = {"files": ("malware.exe", b"infected content", "application/octet-stream")}
+        files = [
+            ("files", ("file1.txt", b"content 1", "text/plain")),
+            ("files", ("file2.txt", b"content 2", "text/plain")),
+            ("files", ("file3.txt", b"content 3", "text/plain")),
+        ]
         response = client.post("/api/v1/scan", files=files)
 
         assert response.status_code == 200
         data = response.json()
-        assert data["infected_files"] == 1
-        assert data["results"][0]["virus_signature"] == "Win.Test.EICAR_HDB-1"
+        assert data["total_files"] == 3
 
-    @patch("app.routers.scan.clamav_client")
-    def test_scan_multiple_files(self, mock_client, client):
+    def test_scan_mixed_results_counted(
+        self, mock_client, client, clean_result, infected_result, error_result
+    ):
+        results = {
+            "clean.txt": (clean_result, None),
+            "malware.exe": (infected_result, None),
+            "error.bin": (error_result, "Scan error occurred"),
+        }
         mock_client.client = MagicMock()
-        mock_client.scan_stream.return_value = (
-            FileScanResult(
-                filename="test.txt",
-                size_bytes=1024,
-                sha256_hash="abc123",
-                status="clean",
-                virus_signature=None,
-                scan_time_seconds=0.1,
-                timestamp=datetime.utcnow(),
-            ),
-            None,
-        )
+        mock_client.scan_stream.side_effect = lambda file_obj, filename: results[filename]
 
         files = [
-            ("files", ("file1.txt", b"content 1", "text/plain")),
-            ("files", ("file2.txt", b"content 2", "text/plain")),
-            ("files", ("file3.txt", b"content 3", "text/plain")),
+            ("files", ("clean.txt", b"clean content", "text/plain")),
+            ("files", ("malware.exe", b"infected content", "application/octet-stream")),
+            ("files", ("error.bin", b"broken content", "application/octet-stream")),
         ]
         response = client.post("/api/v1/scan", files=files)
 
         assert response.status_code == 200
         data = response.json()
         assert data["total_files"] == 3
+        assert data["clean_files"] == 1
+        assert data["infected_files"] == 1
+        assert data["error_files"] == 1
+        assert [r["status"] for r in data["results"]] == ["clean", "infected", "error"]
+
+    def test_scan_duplicate_files_scanned_once(self, mock_client, client):
+        def slow_scan(file_obj, filename):
+            time.sleep(0.1)
+            return (
+                FileScanResult(
+                    filename=filename,
+                    size_bytes=9,
+                    sha256_hash="abc123",
+                    status="clean",
+                    virus_signature=None,
+                    scan_time_seconds=0.1,
+                    timestamp=datetime.utcnow(),
+                ),
+                None,
+            )
+
+        mock_client.client = MagicMock()
+        mock_client.scan_stream.side_effect = slow_scan
+
+        files = [
+            ("files", ("file1.txt", b"same content", "text/plain")),
+            ("files", ("file2.txt", b"same content", "text/plain")),
+        ]
+        response = client.post("/api/v1/scan", files=files)
+
+        assert response.status_code == 200
+        data = response.json()
+        assert data["clean_files"] == 2
+        assert [r["filename"] for r in data["results"]] == ["file1.txt", "file2.txt"]
+        assert mock_client.scan_stream.call_count == 1
+
+    def test_scan_many_files_concurrently(self, mock_client, client, clean_result, monkeypatch):
+        scans = ScanTracker(clean_result)
+        monkeypatch.setattr("app.routers.scan.settings.max_files", 20)
+        monkeypatch.setattr("app.routers.scan.settings.scan_concurrency", 16)
+        mock_client.client = MagicMock()
+        mock_client.scan_stream.side_effect = scans
+
+        files = [
+            ("files", (f"file{i}.txt", f"content {i}".encode(), "text/plain"))
+            for i in range(20)
+        ]
+        response = client.post("/api/v1/scan", files=files)
+
+        assert response.status_code == 200
+        assert response.json()["clean_files"] == 20
+        assert mock_client.scan_stream.call_count == 20
+        assert 1 < scans.peak <= 16
+
+    def test_concurrent_requests_scanned_in_parallel(self, mock_client, aclient, clean_result):
+        scans = ScanTracker(clean_result)
+        mock_client.client = MagicMock()
+        mock_client.scan_stream.side_effect = scans
+
+        async def scan_all():
+            async with aclient:
+                return await asyncio.gather(
+                    *(
+                        aclient.post(
+                            "/api/v1/scan",
+                            files={"files": (f"file{i}.txt", f"content {i}".encode())},
+                        )
+                        for i in range(8)
+                    )
+                )
+
+        responses = asyncio.run(scan_all())
+
+        assert all(response.status_code == 200 for response in responses)
+        assert mock_client.scan_stream.call_count == 8
+        assert 1 < scans.peak <= 8
 
-    @patch("app.routers.scan.clamav_client")
     def test_scan_no_files(self, mock_client, client):
         mock_client.client = MagicMock()
 
         response = client.post("/api/v1/scan")
         assert response.status_code == 422  # Validation error
 
-    @patch("app.routers.scan.clamav_client")
     def test_scan_service_unavailable(self, mock_client, client):
         mock_client.client = None
 
@@ -156,7 +279,6 @@ class TestScanEndpoint:
 
         assert response.status_code == 503
 
-    @patch("app.routers.scan.clamav_client")
     @patch("app.routers.scan.settings")
     def test_scan_too_many_files(self, mock_settings, mock_client, client):
         mock_client.client = MagicMock()
@@ -172,25 +294,118 @@ class TestScanEndpoint:
         assert response.status_code == 400
         assert "Maximum" in response.json()["detail"]
 
-    @patch("app.routers.scan.clamav_client")
-    def test_scan_with_error(self, mock_client, client):
+    @patch("app.routers.scan.settings")
+    def test_scan_file_too_large(self, mock_settings, mock_client, client):
+        mock_client.client = MagicMock()
+        mock_settings.max_files = 10
+        mock_settings.max_file_size = 4
+        mock_settings.scan_concurrency = 4
+
+        files = {"files": ("big.bin", b"too much content", "application/octet-stream")}
+        response = client.post("/api/v1/scan", files=files)
+
+        assert response.status_code == 200
+        data = response.json()
+        assert data["error_files"] == 1
+        assert data["results"][0]["size_bytes"] == 16
+        mock_client.scan_stream.assert_not_called()
+
+    @patch("app.routers.scan.cache_client")
+    def test_scan_duplicate_files_looked_up_once(self, mock_cache, mock_client, client):
         mock_client.client = MagicMock()
-        mock_client.scan_stream.return_value = (
-            FileScanResult(
-                filename="error.bin",
-                size_bytes=0,
-                sha256_hash="",
-                status="error",
+        content = b"x" * 5000
+        sha256_hash = hashlib.sha256(content).hexdigest()
+        mock_cache.get_many = AsyncMock()
+        mock_cache.get_many.return_value = {
+            sha256_hash: FileScanResult(
+                filename="original.bin",
+                size_bytes=5000,
+                sha256_hash=sha256_hash,
+                status="clean",
                 virus_signature=None,
-                scan_time_seconds=0,
+                scan_time_seconds=0.1,
                 timestamp=datetime.utcnow(),
-            ),
-            "Scan error occurred",
-        )
+            )
+        }
 
-        files = {"files": ("error.bin", b"content", "application/octet-stream")}
+        files = [
+            ("files", (f"copy{i}.bin", content, "application/octet-stream"))
+            for i in range(3)
+        ]
         response = client.post("/api/v1/scan", files=files)
 
         assert response.status_code == 200
         data = response.json()
-        assert data["error_files"] == 1
+        assert data["clean_files"] == 3
+        assert all(r["cached"] for r in data["results"])
+        mock_cache.get_many.assert_called_once_with([sha256_hash])
+        mock_client.scan_stream.assert_not_called()
+
+    @patch("app.routers.scan.cache_client")
+    def test_scan_errors_not_cached(self, mock_cache, mock_client, client, error_result):
+        mock_client.client = MagicMock()
+        mock_client.scan_stream.return_value = (error_result, "Scan error occurred")
+        mock_cache.get_many = AsyncMock(return_value={})
+        mock_cache.set_many = AsyncMock()
+
+        files = {"files": ("error.bin", b"x" * 5000, "application/octet-stream")}
+        response = client.post("/api/v1/scan", files=files)
+
+        assert response.status_code == 200
+        assert response.json()["error_files"] == 1
+        mock_cache.set_many.assert_not_called()
+
+    def test_scan_empty_file(self, mock_client, client):
+        mock_client.client = MagicMock()
+
+        files = {"files": ("empty.txt", b"", "text/plain")}
+        response = client.post("/api/v1/scan", files=files)
+
+        assert response.status_code == 200
+        data = response.json()
+        assert data["clean_files"] == 1
+        assert data["results"][0]["size_bytes"] == 0
+        mock_client.scan_stream.assert_not_called()
+
+
+class TestScanStreamEndpoint:
+    def test_scan_stream_clean(self, mock_client, client, clean_result):
+        mock_client.client = MagicMock()
+        mock_client.scan_stream.return_value = (clean_result, None)
+
+        response = client.post("/api/v1/scan-stream?filename=test.txt", content=b"clean content")
+
+        assert response.status_code == 200
+        assert response.json()["status"] == "clean"
+        file_obj, filename = mock_client.scan_stream.call_args.args
+        assert filename == "test.txt"
+
+    @patch("app.routers.scan.cache_client")
+    def test_scan_stream_error_not_cached(self, mock_cache, mock_client, client, error_result):
+        mock_client.client = MagicMock()
+        mock_client.scan_stream.return_value = (error_result, "Scan error occurred")
+        mock_cache.get_scan_result = AsyncMock(return_value=None)
+        mock_cache.set_scan_result = AsyncMock()
+
+        response = client.post("/api/v1/scan-stream?filename=error.bin", content=b"x" * 5000)
+
+        assert response.status_code == 200
+        assert response.json()["status"] == "error"
+        mock_cache.set_scan_result.assert_not_called()
+
+    @patch("app.routers.scan.settings")
+    def test_scan_stream_too_large(self, mock_settings, mock_client, client):
+        mock_client.client = MagicMock()
+        mock_settings.max_file_size = 4
+
+        response = client.post("/api/v1/scan-stream", content=b"too much content")
+
+        assert response.status_code == 413
+        mock_client.scan_stream.assert_not_called()
+
+    def test_scan_stream_service_unavailable(self, mock_client, client):
+        mock_client.client = None
+
+        response = client.post("/api/v1/scan-stream", content=b"content")
+
+        assert response.status_code == 503
@@ -0,0 +1,11 @@
+class FakeClamd:
+    """Stand-in for a clamd socket connection that answers ping and version."""
+
+    def __init__(self, **kwargs):
+        self.kwargs = kwargs
+
+    def ping(self):
+        return "PONG"
+
+    def version(self):
+        return "ClamAV 1.0.0"
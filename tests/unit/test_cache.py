@@ -0,0 +1,86 @@
+import asyncio
+from datetime import datetime
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from app.models import FileScanResult
+from app.services.cache import CacheClient, _L1Cache, _decode_result, _encode_result
+
+
+def make_result(sha256_hash="abc123"):
+    return FileScanResult(
+        filename="test.txt",
+        size_bytes=1024,
+        sha256_hash=sha256_hash,
+        status="clean",
+        virus_signature=None,
+        scan_time_seconds=0.1,
+        timestamp=datetime.utcnow(),
+    )
+
+
+class TestL1Cache:
+    def test_get_set(self):
+        l1 = _L1Cache(max_size=2, ttl=60)
+        result = make_result()
+        l1.set("abc123", result)
+        assert l1.get("abc123") is result
+        assert l1.get("missing") is None
+
+    def test_evicts_least_recently_used(self):
+        l1 = _L1Cache(max_size=2, ttl=60)
+        l1.set("a", make_result("a"))
+        l1.set("b", make_result("b"))
+        l1.get("a")
+        l1.set("c", make_result("c"))
+
+        assert l1.get("a") is not None
+        assert l1.get("b") is None
+        assert l1.get("c") is not None
+
+    def test_entries_expire(self):
+        l1 = _L1Cache(max_size=2, ttl=60)
+        with patch("app.services.cache.monotonic", return_value=0):
+            l1.set("abc123", make_result())
+        with patch("app.services.cache.monotonic", return_value=60):
+            assert l1.get("abc123") is None
+
+
+class TestCacheClient:
+    def test_encode_decode_round_trip(self):
+        result = make_result()
+        assert _decode_result(_encode_result(result)) == result
+
+    def test_get_scan_result_served_from_l1(self):
+        client = CacheClient()
+        client.client = AsyncMock()
+        result = make_result()
+        client.client.mget.return_value = [_encode_result(result)]
+
+        first = asyncio.run(client.get_scan_result("abc123"))
+        second = asyncio.run(client.get_scan_result("abc123"))
+
+        assert first == result
+        assert second is first
+        client.client.mget.assert_called_once_with(["scan:v2:abc123"])
+
+    def test_get_many_fetches_only_l1_misses(self):
+        client = CacheClient()
+        client.client = AsyncMock()
+        client.l1.set("a", make_result("a"))
+        client.client.mget.return_value = [_encode_result(make_result("b")), None]
+
+        found = asyncio.run(client.get_many(["a", "b", "c"]))
+
+        assert set(found) == {"a", "b"}
+        client.client.mget.assert_called_once_with(["scan:v2:b", "scan:v2:c"])
+
+    def test_set_scan_result_populates_l1(self):
+        client = CacheClient()
+        client.client = MagicMock()
+        client.client.pipeline.return_value.execute = AsyncMock()
+        client.client.mget = AsyncMock()
+        result = make_result()
+
+        assert asyncio.run(client.set_scan_result("abc123", result)) is True
+        assert asyncio.run(client.get_scan_result("abc123")) is result
+        client.client.mget.assert_not_called()
@@ -1,7 +1,22 @@
+import asyncio
+import hashlib
 import io
+import struct
 from unittest.mock import MagicMock, patch
 
-from app.services.clamav_client import ClamAVClient
+from app.services.clamav_client import ClamAVClient, ClamdNetworkSocket
+
+from .fakes import FakeClamd
+
+
+def _network_socket(response):
+    """Build a ClamdNetworkSocket whose connection is mocked to answer with response."""
+    clamd_socket = ClamdNetworkSocket(host="localhost", port=3310)
+    clamd_socket.clamd_socket = MagicMock()
+    clamd_socket._init_socket = MagicMock()
+    clamd_socket._send_command = MagicMock()
+    clamd_socket._recv_response = MagicMock(return_value=response)
+    return clamd_socket
 
 
 class TestClamAVClient:
@@ -9,12 +24,8 @@ class TestClamAVClient:
         client = ClamAVClient()
         assert client.client is None
 
-    @patch("app.services.clamav_client.clamd")
-    def test_connect_tcp_success(self, mock_clamd):
-        mock_clamd_instance = MagicMock()
-        mock_clamd_instance.ping.return_value = "PONG"
-        mock_clamd_instance.version.return_value = "ClamAV 1.0.0"
-        mock_clamd.ClamD.return_value = mock_clamd_instance
+    def test_connect_tcp_success(self, monkeypatch):
+        monkeypatch.setattr("app.services.clamav_client.ClamdNetworkSocket", FakeClamd)
 
         with patch("app.services.clamav_client.settings") as mock_settings:
             mock_settings.clamav_type = "tcp"
@@ -26,14 +37,14 @@ class TestClamAVClient:
             result = client.connect()
 
             assert result is True
-            assert client.client is not None
+            assert client.client.kwargs == {
+                "host": "localhost",
+                "port": 3310,
+                "timeout": mock_settings.clamav_timeout,
+            }
 
-    @patch("app.services.clamav_client.clamd")
-    def test_connect_unix_success(self, mock_clamd):
-        mock_clamd_instance = MagicMock()
-        mock_clamd_instance.ping.return_value = "PONG"
-        mock_clamd_instance.version.return_value = "ClamAV 1.0.0"
-        mock_clamd.ClamD.return_value = mock_clamd_instance
+    def test_connect_unix_success(self, monkeypatch):
+        monkeypatch.setattr("app.services.clamav_client.ClamdUnixSocket", FakeClamd)
 
         with patch("app.services.clamav_client.settings") as mock_settings:
             mock_settings.clamav_type = "unix"
@@ -44,6 +55,10 @@ class TestClamAVClient:
             result = client.connect()
 
             assert result is True
+            assert client.client.kwargs == {
+                "path": "/var/run/clamav/clamd.ctl",
+                "timeout": mock_settings.clamav_timeout,
+            }
 
     def test_connect_unknown_type(self):
         client = ClamAVClient()
@@ -89,69 +104,282 @@ class TestClamAVClient:
         client.client.version.side_effect = Exception("Error")
         assert client.get_version() is None
 
-    def test_scan_stream_no_client(self):
+    def test_ping_cached(self):
+        client = ClamAVClient()
+        client.client = MagicMock()
+        client.client.ping.return_value = "PONG"
+
+        assert client.ping(max_age=5) is True
+        assert client.ping(max_age=5) is True
+        client.client.ping.assert_called_once()
+
+        # Without max_age the daemon is always pinged
+        assert client.ping() is True
+        assert client.client.ping.call_count == 2
+
+    def test_get_version_cached(self):
         client = ClamAVClient()
-        file_obj = io.BytesIO(b"test content")
-        result, error = client.scan_stream(file_obj, "test.txt")
+        client.client = MagicMock()
+        client.client.version.return_value = "ClamAV 1.0.0"
+
+        assert client.get_version() == "ClamAV 1.0.0"
+        assert client.get_version() == "ClamAV 1.0.0"
+        client.client.version.assert_called_once()
+
+    def test_get_version_failure_not_cached(self):
+        client = ClamAVClient()
+        client.client = MagicMock()
+        client.client.version.side_effect = [Exception("Error"), "ClamAV 1.0.0"]
+
+        assert client.get_version() is None
+        assert client.get_version() == "ClamAV 1.0.0"
+
+    def test_scan_stream_no_client(self, sample_clean_file):
+        client = ClamAVClient()
+        result, error = client.scan_stream(sample_clean_file, "test.txt")
 
         assert result.status == "error"
         assert error == "ClamAV client not connected"
 
-    def test_scan_stream_clean_file(self):
+    def test_scan_stream_clean_file(self, sample_clean_file):
         client = ClamAVClient()
         client.client = MagicMock()
         client.client.instream.return_value = None  # None means clean
 
-        file_obj = io.BytesIO(b"clean file content")
-        result, error = client.scan_stream(file_obj, "clean.txt")
+        result, error = client.scan_stream(sample_clean_file, "clean.txt")
 
         assert result.status == "clean"
         assert result.filename == "clean.txt"
         assert result.virus_signature is None
         assert error is None
 
-    def test_scan_stream_infected_file(self):
+    def test_scan_stream_infected_file(self, sample_eicar_file):
         client = ClamAVClient()
         client.client = MagicMock()
         client.client.instream.return_value = {
             "stream": ("FOUND", "Win.Test.EICAR_HDB-1")
         }
 
-        file_obj = io.BytesIO(b"infected content")
-        result, error = client.scan_stream(file_obj, "malware.exe")
+        result, error = client.scan_stream(sample_eicar_file, "malware.exe")
 
         assert result.status == "infected"
         assert result.virus_signature == "Win.Test.EICAR_HDB-1"
         assert error is None
 
-    def test_scan_stream_exception(self):
+    def test_scan_stream_ok_response_is_clean(self, sample_clean_file):
+        client = ClamAVClient()
+        client.client = MagicMock()
+        client.client.instream.return_value = {"stream": ("OK", None)}
+
+        result, error = client.scan_stream(sample_clean_file, "clean.txt")
+
+        assert result.status == "clean"
+        assert result.virus_signature is None
+        assert error is None
+
+    def test_scan_stream_exception(self, sample_clean_file):
         client = ClamAVClient()
         client.client = MagicMock()
         client.client.instream.side_effect = Exception("Scan error")
 
-        file_obj = io.BytesIO(b"some content")
-        result, error = client.scan_stream(file_obj, "file.txt")
+        result, error = client.scan_stream(sample_clean_file, "file.txt")
 
         assert result.status == "error"
         assert error == "Scan error"
 
+    def test_scan_stream_error_response(self, sample_clean_file):
+        client = ClamAVClient()
+        client.client = MagicMock()
+        client.client.instream.return_value = {"stream": ("ERROR", "Can't allocate memory")}
+
+        result, error = client.scan_stream(sample_clean_file, "file.txt")
+
+        assert result.status == "error"
+        assert result.sha256_hash == ""
+        assert error == "Can't allocate memory"
+
     def test_scan_stream_calculates_hash(self):
+        def drain(buff):
+            # clamd reads the stream in chunks; the hash is taken as it goes
+            while buff.read(4):
+                pass
+
         client = ClamAVClient()
         client.client = MagicMock()
-        client.client.instream.return_value = None
+        client.client.instream.side_effect = drain
 
         content = b"test content for hashing"
         file_obj = io.BytesIO(content)
         result, _ = client.scan_stream(file_obj, "test.txt")
 
-        # SHA256 of "test content for hashing"
-        import hashlib
+        assert result.size_bytes == len(content)
 
+        # SHA256 of "test content for hashing"
         expected_hash = hashlib.sha256(content).hexdigest()
         assert result.sha256_hash == expected_hash
 
+    def test_scan_stream_hashes_readinto(self):
+        def drain(buff):
+            buffer = memoryview(bytearray(4))
+            while buff.readinto(buffer):
+                pass
+
+        client = ClamAVClient()
+        client.client = MagicMock()
+        client.client.instream.side_effect = drain
+
+        content = b"test content for hashing"
+        result, _ = client.scan_stream(io.BytesIO(content), "test.txt")
+
+        assert result.size_bytes == len(content)
+        assert result.sha256_hash == hashlib.sha256(content).hexdigest()
+
+    def test_scan_stream_hashes_while_streaming(self):
+        clamd_socket = _network_socket("stream: OK")
+        sent = []
+        clamd_socket.clamd_socket.sendall.side_effect = lambda data: sent.append(bytes(data))
+
+        client = ClamAVClient()
+        client.client = clamd_socket
+        content = bytes(range(256)) * 1024  # four 64KB chunks
+
+        with patch("app.services.clamav_client.settings") as mock_settings:
+            mock_settings.clamav_chunk_size = 64 * 1024
+            result, error = client.scan_stream(io.BytesIO(content), "test.bin")
+
+        assert error is None
+        assert result.size_bytes == len(content)
+        assert result.sha256_hash == hashlib.sha256(content).hexdigest()
+        # Every chunk went to clamd with its length prefix, then the terminator
+        assert b"".join(chunk[4:] for chunk in sent[:-1]) == content
+        assert len(sent) == 5
+
     def test_disconnect(self):
         client = ClamAVClient()
         client.client = MagicMock()
         client.disconnect()
         assert client.client is None
+
+
+class TestClamdNetworkSocket:
+    def test_instream_sends_configured_chunk_size(self):
+        clamd_socket = _network_socket("stream: OK")
+        sent = []
+        # The send buffer is reused between chunks, so copy what was sent
+        clamd_socket.clamd_socket.sendall.side_effect = lambda data: sent.append(bytes(data))
+
+        with patch("app.services.clamav_client.settings") as mock_settings:
+            mock_settings.clamav_chunk_size = 4
+            result = clamd_socket.instream(io.BytesIO(b"0123456789"))
+
+        assert sent == [
+            struct.pack("!L", 4) + b"0123",
+            struct.pack("!L", 4) + b"4567",
+            struct.pack("!L", 2) + b"89",
+            struct.pack("!L", 0),
+        ]
+        assert result == {"stream": ("OK", None)}
+
+    def test_instream_found(self):
+        clamd_socket = _network_socket("stream: Win.Test.EICAR_HDB-1 FOUND")
+
+        result = clamd_socket.instream(io.BytesIO(b"infected content"))
+
+        assert result == {"stream": ("FOUND", "Win.Test.EICAR_HDB-1")}
+
+
+async def _stream(*chunks):
+    for chunk in chunks:
+        yield chunk
+
+
+class TestScanStreamAsync:
+    def _scan(self, reply, *chunks):
+        """Run scan_stream_async against a fake clamd that answers with reply."""
+        received = []
+
+        async def handle(reader, writer):
+            received.append(await reader.readexactly(len(b"zINSTREAM\0")))
+            while True:
+                (size,) = struct.unpack("!L", await reader.readexactly(4))
+                if not size:
+                    break
+                received.append(await reader.readexactly(size))
+            writer.write(reply)
+            await writer.drain()
+            writer.close()
+
+        async def run():
+            server = await asyncio.start_server(handle, "127.0.0.1", 0)
+            async with server:
+                with patch("app.services.clamav_client.settings") as mock_settings:
+                    mock_settings.clamav_host = "127.0.0.1"
+                    mock_settings.clamav_port = server.sockets[0].getsockname()[1]
+                    mock_settings.clamav_timeout = 5
+                    mock_settings.clamav_chunk_size = 4
+                    mock_settings.clamav_socket_send_buffer = 64 * 1024
+
+                    client = ClamAVClient()
+                    client.connection_type = "tcp"
+                    client.client = ClamdNetworkSocket()
+                    return await client.scan_stream_async(_stream(*chunks), "test.txt")
+
+        result, error = asyncio.run(run())
+        return result, error, received
+
+    def test_clean(self):
+        result, error, received = self._scan(b"stream: OK\0", b"0123456789", b"ab")
+
+        assert error is None
+        assert result.status == "clean"
+        assert result.size_bytes == 12
+        assert result.sha256_hash == hashlib.sha256(b"0123456789ab").hexdigest()
+        assert received == [b"zINSTREAM\0", b"0123", b"4567", b"89", b"ab"]
+
+    def test_infected(self):
+        result, error, _ = self._scan(b"stream: Win.Test.EICAR_HDB-1 FOUND\0", b"infected")
+
+        assert error is None
+        assert result.status == "infected"
+        assert result.virus_signature == "Win.Test.EICAR_HDB-1"
+
+    def test_size_limit_exceeded(self):
+        result, error, _ = self._scan(b"INSTREAM size limit exceeded. ERROR\0", b"content")
+
+        assert result.status == "error"
+        assert "size limit" in error
+        assert result.size_bytes == 0
+        assert result.sha256_hash == ""
+
+    def test_connection_refused(self):
+        async def run():
+            # Bind a port, then close it so nothing is listening there
+            server = await asyncio.start_server(lambda reader, writer: None, "127.0.0.1", 0)
+            port = server.sockets[0].getsockname()[1]
+            server.close()
+            await server.wait_closed()
+
+            with patch("app.services.clamav_client.settings") as mock_settings:
+                mock_settings.clamav_host = "127.0.0.1"
+                mock_settings.clamav_port = port
+                mock_settings.clamav_timeout = 5
+
+                client = ClamAVClient()
+                client.connection_type = "tcp"
+                client.client = ClamdNetworkSocket()
+                return await client.scan_stream_async(_stream(b"content"), "test.txt")
+
+        result, error = asyncio.run(run())
+
+        assert result.status == "error"
+        assert error
+        assert result.size_bytes == 0
+        assert result.sha256_hash == ""
+
+    def test_no_client(self):
+        client = ClamAVClient()
+        result, error = asyncio.run(client.scan_stream_async(_stream(b"content"), "test.txt"))
+
+        assert result.status == "error"
+        assert error == "ClamAV client not connected"
+
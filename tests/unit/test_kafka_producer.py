@@ -0,0 +1,73 @@
+import asyncio
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from app.services.kafka_producer import KafkaProducerClient
+
+
+def make_producer(topics):
+    client = KafkaProducerClient()
+    client.producer = MagicMock()
+    cluster = MagicMock()
+    cluster.topics.return_value = set(topics)
+    client.producer.client.fetch_all_metadata = AsyncMock(return_value=cluster)
+    client.producer.client.cluster.topics.return_value = set()
+    return client
+
+
+class TestTopicExists:
+    def test_known_topic_served_from_cache(self):
+        client = make_producer({"scan-results"})
+
+        assert asyncio.run(client.topic_exists("scan-results")) is True
+        assert asyncio.run(client.topic_exists("scan-results")) is True
+        client.producer.client.fetch_all_metadata.assert_called_once()
+
+    def test_topic_known_to_producer(self):
+        client = make_producer(set())
+        client.producer.client.cluster.topics.return_value = {"scan-results"}
+
+        assert asyncio.run(client.topic_exists("scan-results")) is True
+        client.producer.client.fetch_all_metadata.assert_not_called()
+
+    def test_missing_topic_refresh_is_throttled(self):
+        client = make_producer(set())
+
+        with patch("app.services.kafka_producer.monotonic", return_value=100):
+            assert asyncio.run(client.topic_exists("missing")) is False
+            assert asyncio.run(client.topic_exists("missing")) is False
+        client.producer.client.fetch_all_metadata.assert_called_once()
+
+        with patch("app.services.kafka_producer.monotonic", return_value=105):
+            assert asyncio.run(client.topic_exists("missing")) is False
+        assert client.producer.client.fetch_all_metadata.call_count == 2
+
+    def test_cache_expires(self):
+        client = make_producer({"scan-results"})
+
+        with patch("app.services.kafka_producer.monotonic", return_value=100):
+            assert asyncio.run(client.topic_exists("scan-results")) is True
+        with patch("app.services.kafka_producer.monotonic", return_value=130):
+            assert asyncio.run(client.topic_exists("scan-results")) is True
+        assert client.producer.client.fetch_all_metadata.call_count == 2
+
+
+class TestSendBatch:
+    def test_batch_sent_without_waiting(self):
+        async def run():
+            client = make_producer({"scan-results"})
+            delivery = asyncio.get_running_loop().create_future()
+            client.producer.send = AsyncMock(return_value=delivery)
+
+            # Returns while the delivery is still pending
+            await client._send_batch([("scan-results", {"request_id": "r1"}, None)])
+            assert not delivery.done()
+            client.producer.send.assert_called_once_with(
+                "scan-results", value={"request_id": "r1"}, key="r1"
+            )
+
+            with patch("app.services.kafka_producer.logger") as mock_logger:
+                delivery.set_exception(Exception("broker unavailable"))
+                await asyncio.sleep(0)
+            mock_logger.error.assert_called_once()
+
+        asyncio.run(run())
@@ -1,9 +1,13 @@
 from datetime import datetime
 
 import pytest
+from pydantic import ValidationError
 
 from app.models import FileScanResult, HealthResponse, ScanResponse, VersionResponse
 
+# A fixed scan time keeps the results deterministic
+TIMESTAMP = datetime(2026, 1, 31, 10, 30)
+
 
 class TestFileScanResult:
     def test_create_clean_result(self):
@@ -14,12 +18,13 @@ class TestFileScanResult:
             status="clean",
             virus_signature=None,
             scan_time_seconds=0.5,
-            timestamp=datetime.utcnow(),
+            timestamp=TIMESTAMP,
         )
         assert result.filename == "test.txt"
         assert result.size_bytes == 1024
         assert result.status == "clean"
         assert result.virus_signature is None
+        assert result.model_dump(mode="json")["timestamp"] == "2026-01-31T10:30:00"
 
     def test_create_infected_result(self):
         result = FileScanResult(
@@ -29,7 +34,7 @@ class TestFileScanResult:
             status="infected",
             virus_signature="Win.Test.EICAR_HDB-1",
             scan_time_seconds=0.3,
-            timestamp=datetime.utcnow(),
+            timestamp=TIMESTAMP,
         )
         assert result.status == "infected"
         assert result.virus_signature == "Win.Test.EICAR_HDB-1"
@@ -42,10 +47,27 @@ class TestFileScanResult:
             status="error",
             virus_signature=None,
             scan_time_seconds=0,
-            timestamp=datetime.utcnow(),
+            timestamp=TIMESTAMP,
         )
         assert result.status == "error"
 
+    def test_result_is_frozen(self):
+        result = FileScanResult.model_construct(
+            filename="test.txt",
+            size_bytes=1024,
+            sha256_hash="abc123",
+            status="clean",
+            virus_signature=None,
+            scan_time_seconds=0.5,
+            timestamp=TIMESTAMP,
+        )
+        with pytest.raises(ValidationError):
+            result.status = "infected"
+
+        copy = result.model_copy(update={"cached": True})
+        assert copy.cached is True
+        assert result.cached is False
+
 
 class TestScanResponse:
     def test_create_scan_response(self):
@@ -56,7 +78,7 @@ class TestScanResponse:
             status="clean",
             virus_signature=None,
             scan_time_seconds=0.5,
-            timestamp=datetime.utcnow(),
+            timestamp=TIMESTAMP,
         )
         response = ScanResponse(
             total_files=1,
@@ -70,27 +92,27 @@ class TestScanResponse:
         assert len(response.results) == 1
 
     def test_scan_response_with_multiple_files(self):
-        results = [
-            FileScanResult(
-                filename=f"file{i}.txt",
-                size_bytes=1024,
-                sha256_hash=f"hash{i}",
-                status="clean",
-                virus_signature=None,
-                scan_time_seconds=0.1,
-                timestamp=datetime.utcnow(),
-            )
-            for i in range(3)
-        ]
+        # Results are frozen, so one instance can stand for all three files
+        result = FileScanResult(
+            filename="file.txt",
+            size_bytes=1024,
+            sha256_hash="hash",
+            status="clean",
+            virus_signature=None,
+            scan_time_seconds=0.1,
+            timestamp=TIMESTAMP,
+        )
         response = ScanResponse(
             total_files=3,
             clean_files=3,
             infected_files=0,
             error_files=0,
-            results=results,
+            results=[result] * 3,
         )
         assert response.total_files == 3
         assert len(response.results) == 3
+        # Already-built results are kept as-is, not revalidated into copies
+        assert all(r is result for r in response.results)
 
 
 class TestHealthResponse:
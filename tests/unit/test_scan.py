@@ -0,0 +1,117 @@
+import asyncio
+import hashlib
+import io
+import tempfile
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+
+from app.routers.scan import coalesce_scan, digest_file, limit_stream, process_s3_scan
+
+CONTENT = b"spooled upload content" * 100
+
+
+class TestDigestFile:
+    def test_in_memory_spooled_file(self):
+        with tempfile.SpooledTemporaryFile(max_size=1024 * 1024) as f:
+            f.write(CONTENT)
+            assert digest_file(f) == hashlib.sha256(CONTENT).hexdigest()
+            assert not f._rolled
+
+    def test_rolled_over_spooled_file(self):
+        with tempfile.SpooledTemporaryFile(max_size=16) as f:
+            f.write(CONTENT)
+            assert f._rolled
+            assert digest_file(f) == hashlib.sha256(CONTENT).hexdigest()
+
+    def test_written_after_rollover(self):
+        with tempfile.SpooledTemporaryFile(max_size=10) as f:
+            f.write(b"x" * 20)
+            f.write(b"y" * 5)
+            assert digest_file(f) == hashlib.sha256(b"x" * 20 + b"y" * 5).hexdigest()
+
+    def test_empty_file(self):
+        with tempfile.SpooledTemporaryFile(max_size=0) as f:
+            f.rollover()
+            assert digest_file(f) == hashlib.sha256(b"").hexdigest()
+
+    def test_plain_file_object(self):
+        assert digest_file(io.BufferedReader(io.BytesIO(CONTENT))) == (
+            hashlib.sha256(CONTENT).hexdigest()
+        )
+
+
+class TestCoalesceScan:
+    def test_concurrent_scans_shared(self):
+        calls = []
+
+        async def scan():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return "clean"
+
+        async def run():
+            return await asyncio.gather(*(coalesce_scan("key", scan) for _ in range(3)))
+
+        assert asyncio.run(run()) == ["clean"] * 3
+        assert len(calls) == 1
+
+    def test_waiter_scans_when_owner_cancelled(self):
+        async def hang():
+            await asyncio.Event().wait()
+
+        async def scan():
+            return "clean"
+
+        async def run():
+            owner = asyncio.create_task(coalesce_scan("key", hang))
+            await asyncio.sleep(0)
+            waiter = asyncio.create_task(coalesce_scan("key", scan))
+            await asyncio.sleep(0)
+
+            owner.cancel()
+            assert await waiter == "clean"
+            assert owner.cancelled()
+
+        asyncio.run(run())
+
+
+async def _stream(*chunks):
+    for chunk in chunks:
+        yield chunk
+
+
+class TestLimitStream:
+    def test_within_limit(self):
+        async def run():
+            return [chunk async for chunk in limit_stream(_stream(b"0123", b"45"), 6)]
+
+        assert asyncio.run(run()) == [b"0123", b"45"]
+
+    def test_over_limit(self):
+        async def run():
+            return [chunk async for chunk in limit_stream(_stream(b"0123", b"456"), 6)]
+
+        with pytest.raises(ValueError, match="max size of 6 bytes"):
+            asyncio.run(run())
+
+
+class TestProcessS3Scan:
+    @patch("app.routers.scan.cache_client")
+    @patch("app.routers.scan.s3_client")
+    def test_oversized_object_rejected_before_cache_lookup(self, mock_s3, mock_cache):
+        mock_s3.head_object = AsyncMock(
+            return_value={"size": 10, "sha256": None, "etag": "e", "version_id": None}
+        )
+        mock_cache.get_object_hash = AsyncMock()
+        publish = MagicMock()
+
+        with patch("app.routers.scan.settings") as mock_settings:
+            mock_settings.max_file_size = 4
+            asyncio.run(process_s3_scan("r1", "big.bin", "scans", publish, "kafka"))
+
+        payload = publish.call_args.args[0]
+        assert payload["status"] == "error"
+        assert "max size" in payload["error"]
+        mock_cache.get_object_hash.assert_not_called()
+        mock_s3.open_stream.assert_not_called()